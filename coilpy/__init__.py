@@ -17,7 +17,7 @@ from .netcdf import Netcdf
 from .surface import FourSurf
 from .dipole import Dipole
 from .focushdf5 import FOCUSHDF5
-from .coils import Coil, SingleCoil
+from .coils import Coil, SingleCoil, FourierCoil
 from .stellopt import STELLout
 from .vmec import VMECout
 from .booz_xform import BOOZ_XFORM
@@ -1,6 +1,368 @@
+from contextlib import contextmanager
 import numpy as np
 
 u0_d_4pi = 1.0e-7
+# default memory budget (in bytes) for the vectorized python field evaluations
+max_memory_default = 2**28
+
+
+def _point_blocks(npos, nseg, chunk_size=None, max_memory=None, nbytes=96):
+    """Split evaluation points into blocks to bound the memory of vectorized evaluations.
+
+    Args:
+        npos (int): Number of evaluation points.
+        nseg (int): Number of coil segments.
+        chunk_size (int, optional): Number of points per block. Defaults to None.
+        max_memory (int, optional): Memory budget in bytes, used if `chunk_size` is None.
+                                    Defaults to `max_memory_default`.
+        nbytes (int, optional): Working memory per point and segment in bytes. Defaults to 96.
+
+    Yields:
+        slice: Slice of the evaluation points in one block.
+    """
+    if chunk_size is None:
+        if max_memory is None:
+            max_memory = max_memory_default
+        chunk_size = int(max_memory) // (nbytes * max(nseg, 1))
+    chunk_size = max(int(chunk_size), 1)
+    for start in range(0, npos, chunk_size):
+        yield slice(start, min(start + chunk_size, npos))
+
+
+def _self_delta(radius=None, width=None, height=None):
+    """Regularization delta of the self inductance for a finite coil cross-section.
+
+    Following Hurwitz, Landreman & Antonsen (2023), delta = a^2/sqrt(e) for a circular
+    cross-section of radius a, and delta = a*b*exp(-25/6 + k(a,b)) for a rectangular
+    cross-section of width a and height b.
+
+    Args:
+        radius (float, optional): Radius of the circular cross-section. Defaults to None.
+        width (float, optional): Width of the rectangular cross-section. Defaults to None.
+        height (float, optional): Height of the rectangular cross-section. Defaults to None.
+
+    Returns:
+        float: The regularization delta.
+    """
+    if radius is not None:
+        return np.asarray(radius, dtype=float) ** 2 / np.sqrt(np.e)
+    if width is None or height is None:
+        raise ValueError("Please provide the radius, or the width and height of coils.")
+    a = np.asarray(width, dtype=float)
+    b = np.asarray(height, dtype=float)
+    k = (
+        -(a**4 - 6 * a**2 * b**2 + b**4) / (6 * a**2 * b**2) * np.log(a / b + b / a)
+        + b**2 / (6 * a**2) * np.log(b / a)
+        + a**2 / (6 * b**2) * np.log(a / b)
+        + 4 * a / (3 * b) * np.arctan(b / a)
+        + 4 * b / (3 * a) * np.arctan(a / b)
+    )
+    return a * b * np.exp(-25.0 / 6 + k)
+
+
+def _segment_distance(p1, q1, p2, q2):
+    """Closest points between two sets of straight segments, [p1, q1] and [p2, q2].
+
+    Args:
+        p1, q1 (numpy.ndarray): (n,3) start and end points of the first segments.
+        p2, q2 (numpy.ndarray): (n,3) start and end points of the second segments,
+                                could be degenerate (p2 = q2) for point-segment distances.
+
+    Returns:
+        numpy.ndarray: (n,) distances.
+        numpy.ndarray: (n,3) closest points on the first segments.
+        numpy.ndarray: (n,3) closest points on the second segments.
+    """
+    tiny = np.finfo(float).tiny
+    d1, d2, r = q1 - p1, q2 - p2, p1 - p2
+    a = np.maximum(np.sum(d1 * d1, axis=1), tiny)
+    e = np.sum(d2 * d2, axis=1)
+    b = np.sum(d1 * d2, axis=1)
+    c = np.sum(d1 * r, axis=1)
+    f = np.sum(d2 * r, axis=1)
+    denom = a * e - b * b
+    # closest points of the infinite lines, s = 0 for parallel lines
+    s = np.clip((b * f - c * e) / np.where(denom > 0, denom, np.inf), 0, 1)
+    # the second segment degenerates into a point
+    s = np.where(e > 0, s, np.clip(-c / a, 0, 1))
+    t = (b * s + f) / np.maximum(e, tiny)
+    # clamp t and recompute s
+    s = np.where(t < 0, np.clip(-c / a, 0, 1), s)
+    s = np.where(t > 1, np.clip((b - c) / a, 0, 1), s)
+    t = np.clip(t, 0, 1)
+    c1 = p1 + d1 * s[:, np.newaxis]
+    c2 = p2 + d2 * t[:, np.newaxis]
+    return np.linalg.norm(c1 - c2, axis=1), c1, c2
+
+
+def _fourier_series(coef, num):
+    """Evaluate real Fourier series on a uniform grid with inverse real FFTs.
+
+    Args:
+        coef (numpy.ndarray): (ncoil,nmodes,3) one-sided coefficients c_k, k = 0, 1, ..., the
+                              series being 2*Re(sum_k c_k exp(i*k*theta)).
+        num (int): Number of grid points, theta_j = 2*pi*j/num.
+
+    Returns:
+        numpy.ndarray: (ncoil,num,3) values on the grid.
+    """
+    # fold the modes into the real FFT of length num (aliasing when num is small)
+    index = np.arange(coef.shape[1]) % num
+    flip = index > num // 2
+    index[flip] = num - index[flip]
+    coef = np.array(coef, dtype=complex)
+    coef[:, flip, :] = np.conj(coef[:, flip, :])
+    spec = np.zeros((len(coef), num // 2 + 1, 3), dtype=complex)
+    np.add.at(spec, (slice(None), index), coef)
+    spec *= num
+    spec[:, 0, :] *= 2
+    if num % 2 == 0:
+        spec[:, -1, :] *= 2
+    return np.fft.irfft(spec, n=num, axis=1)
+
+
+def _resample_fft(points, num, nf=-1):
+    """Resample closed curves with the truncated Fourier series of `coilpy.misc.trigfft`.
+
+    Args:
+        points (numpy.ndarray): (ncoil,n,3) points of closed curves, the last point repeating the first.
+        num (int): Number of points after resampling, including the repeated last point.
+        nf (int, optional): Truncation number of `trigfft`, the modes `range(n//2+1)[:nf]`
+                            are kept. Defaults to -1.
+
+    Returns:
+        numpy.ndarray: (ncoil,num,3) resampled points.
+    """
+    n = points.shape[1] - 1
+    coef = np.fft.rfft(points[:, :-1, :], axis=1) / n
+    # one-sided coefficients, the real signal is 2*Re(sum(coef*exp(i*k*theta)))
+    coef[:, 0, :] /= 2
+    if n % 2 == 0:
+        coef[:, -1, :] /= 2
+    modes = np.arange(n // 2 + 1)[:nf]
+    resampled = np.empty((len(points), num, 3))
+    resampled[:, :-1, :] = _fourier_series(coef[:, modes, :], num - 1)
+    resampled[:, -1, :] = resampled[:, 0, :]
+    return resampled
+
+
+def _grid_spectrum(f):
+    """Fourier harmonics of a function on the FOCUS half grid (see `FourSurf.grid`).
+
+    Args:
+        f (numpy.ndarray): (ntheta,nzeta) values at theta = (i+1/2)*2*pi/ntheta and
+                           zeta = (j+1/2)*2*pi/nzeta, zeta in units of one field period.
+
+    Returns:
+        dict: Harmonics of f = sum fc cos(m*theta - n*zeta) + fs sin(m*theta - n*zeta),
+              containing 'xm', 'xn', 'bnc', 'bns' as in `coilpy.misc.read_focus_boundary`.
+    """
+    ntheta, nzeta = np.shape(f)
+    m = np.fft.fftfreq(ntheta, 1.0 / ntheta)
+    k = np.fft.fftfreq(nzeta, 1.0 / nzeta)
+    # shift the phase from the half grid to theta = zeta = 0
+    phase = np.exp(-1j * np.pi * (m[:, np.newaxis] / ntheta + k[np.newaxis, :] / nzeta))
+    coef = np.ravel(np.fft.fft2(f) / (ntheta * nzeta) * phase)
+    # (m, k) and (-m, -k) are complex conjugates, keep one of them
+    index = np.arange(ntheta * nzeta)
+    partner = np.ravel_multi_index(
+        np.meshgrid(
+            -np.arange(ntheta) % ntheta, -np.arange(nzeta) % nzeta, indexing="ij"
+        ),
+        (ntheta, nzeta),
+    ).ravel()
+    keep = index <= partner
+    scale = np.where(index[keep] == partner[keep], 1.0, 2.0)
+    coef = coef[keep]
+    mm, kk = np.meshgrid(m, k, indexing="ij")
+    xm, xn = mm.ravel()[keep].astype(int), -kk.ravel()[keep].astype(int)
+    # f = sum scale*Re(coef*exp(i*(m*theta - n*zeta))), flip to m >= 0 (n >= 0 for m = 0)
+    flip = (xm < 0) | ((xm == 0) & (xn < 0))
+    xm[flip], xn[flip], coef[flip] = -xm[flip], -xn[flip], np.conj(coef[flip])
+    order = np.lexsort((xn, xm))
+    return {
+        "xm": xm[order],
+        "xn": xn[order],
+        "bnc": (scale * coef.real)[order],
+        "bns": (-scale * coef.imag)[order],
+    }
+
+
+def _parallel_transport(tangent, v0, offsets):
+    """Parallel transport (rotation-minimizing) normals along packed coils.
+
+    Hanson & Ma, Parallel Transport Approach to Curve Framing, 1995.
+
+    Args:
+        tangent (numpy.ndarray): (npoints,3) unit tangents of all the coils, one after another.
+        v0 (array_like): (ncoils,3) normal at the first point of each coil.
+        offsets (array_like): (ncoils+1,) starting index of each coil, the last one is npoints.
+
+    Returns:
+        numpy.ndarray: (npoints,3) normals.
+    """
+    from coilpy_fortran import parallel_frame
+
+    return parallel_frame(
+        tangent, np.atleast_2d(v0), np.asarray(offsets, dtype=np.int32)
+    )
+
+
+def _orthonormal_frame(tangent, normal):
+    """Normalize the frame and complete it with the bi-normal.
+
+    Args:
+        tangent (numpy.ndarray): (n,3) unit tangent.
+        normal (numpy.ndarray): (n,3) normal, the component along the tangent is removed.
+
+    Returns:
+        numpy.ndarray: (n,3) unit tangent.
+        numpy.ndarray: (n,3) unit normal.
+        numpy.ndarray: (n,3) unit bi-normal, tangent x normal.
+    """
+    normal = normal - np.sum(normal * tangent, axis=1)[:, np.newaxis] * tangent
+    normal = normal / np.linalg.norm(normal, axis=1)[:, np.newaxis]
+    binormal = np.cross(tangent, normal)
+    binormal = binormal / np.linalg.norm(binormal, axis=1)[:, np.newaxis]
+    return tangent, normal, binormal
+
+
+@contextmanager
+def _open_file(file, mode="r"):
+    """Open a file name, a gzip file name (*.gz) or pass through an opened file object."""
+    if hasattr(file, "read") or hasattr(file, "write"):
+        yield file
+    elif str(file).endswith(".gz"):
+        import gzip
+
+        with gzip.open(file, mode if "b" in mode else mode + "t") as f:
+            yield f
+    else:
+        with open(file, mode) as f:
+            yield f
+
+
+def _write_rows(wfile, fmt, values, chunk_size=2**16):
+    """Write the rows of a 2D array formatted with `fmt` (printf-style, one row) in blocks."""
+    for start in range(0, len(values), chunk_size):
+        block = values[start : start + chunk_size]
+        wfile.write((fmt * len(block)) % tuple(block.ravel().tolist()))
+
+
+def _parse_makegrid(data):
+    """Parse the coil blocks of a MAKEGRID file (after the header) in bulk.
+
+    Lines with 4 columns are coil points, lines with more columns end a coil
+    (x y z 0.0 group name) and the first line with less than 4 columns ends the file.
+
+    Args:
+        data (bytes): Complete lines of the coil blocks.
+
+    Returns:
+        numpy.ndarray: (nlines,4) the first 4 columns of each line.
+        numpy.ndarray: Line indices of the coil terminators.
+        list: (group, name) strings of each terminator, name is None if missing.
+        bool: If the end of the coil blocks is reached.
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    starts = np.concatenate(([0], np.flatnonzero(raw == 10) + 1))
+    if starts[-1] == len(raw):
+        starts = starts[:-1]
+    # number of columns in each line
+    space = raw <= 32
+    first = ~space
+    first[1:] &= space[:-1]
+    heads = np.flatnonzero(first)
+    del space, first
+    columns = np.diff(np.searchsorted(heads, np.append(starts, len(raw))))
+    short = np.flatnonzero(columns < 4)
+    finished = len(short) > 0
+    if finished:
+        data = data[: starts[short[0]]]
+        starts = starts[: short[0]]
+        columns = columns[: short[0]]
+    ends = np.concatenate((starts[1:], [len(data)]))
+    # keep only the first 4 columns of the terminators
+    terminators = np.flatnonzero(columns > 4)
+    pieces, fields, start = [], [], 0
+    for line in terminators:
+        tokens = data[starts[line] : ends[line]].split()
+        pieces += [data[start : starts[line]], b" ".join(tokens[:4]), b"\n"]
+        fields.append(
+            (tokens[4].decode(), tokens[5].decode() if len(tokens) > 5 else None)
+        )
+        start = ends[line]
+    pieces.append(data[start:])
+    values = np.fromstring(b"".join(pieces), sep=" ").reshape(-1, 4)
+    return values, terminators, fields, finished
+
+
+def _makegrid_coils(coilfile, chunk_size=2**22):
+    """Read the coils from a MAKEGRID file object (after the header) chunk by chunk.
+
+    Args:
+        coilfile (file): File opened in binary mode.
+        chunk_size (int, optional): Number of bytes parsed at once. Defaults to 2**22.
+
+    Yields:
+        tuple: (xyz, current, group, name) of each coil, the group and name are strings
+               (name is None if missing).
+    """
+    pending, rest, current = [], b"", 0.0
+    while True:
+        chunk = coilfile.read(chunk_size)
+        data = rest + chunk
+        cut = data.rfind(b"\n") + 1 if chunk else len(data)
+        data, rest = data[:cut], data[cut:]
+        values, terminators, fields, finished = _parse_makegrid(data)
+        row = 0
+        for line, (group, name) in zip(terminators, fields):
+            points = np.concatenate(pending + [values[row : line + 1]])
+            # the current is given by the last 4-column line
+            if len(points) > 1:
+                current = points[-2, 3]
+            yield points[:, :3], current, group, name
+            pending, row = [], line + 1
+        if row < len(values):
+            pending.append(values[row:])
+        if finished or not chunk:
+            return
+
+
+def _makegrid_singlecoils(coilfile, group=None, name=None, chunk_size=2**22):
+    """Read the coils from a MAKEGRID file object (after the header) as SingleCoil.
+
+    Args:
+        coilfile (file): File opened in binary mode.
+        group (int or list, optional): Only yield the coils in these groups. Defaults to None.
+        name (str or list, optional): Only yield the coils with these names. Defaults to None.
+        chunk_size (int, optional): Number of bytes parsed at once. Defaults to 2**22.
+
+    Yields:
+        SingleCoil: The coils one by one.
+    """
+    groups = None if group is None else set(np.atleast_1d(group).tolist())
+    names = None if name is None else set(np.atleast_1d(name).tolist())
+    for i, (xyz, current, igroup, iname) in enumerate(
+        _makegrid_coils(coilfile, chunk_size)
+    ):
+        try:
+            igroup = int(igroup)
+        except ValueError:
+            igroup = i + 1
+        iname = "coil" if iname is None else iname
+        if groups is not None and igroup not in groups:
+            continue
+        if names is not None and iname not in names:
+            continue
+        yield SingleCoil(
+            x=xyz[:, 0],
+            y=xyz[:, 1],
+            z=xyz[:, 2],
+            I=current,
+            name=iname,
+            group=igroup,
+        )
 
 
 class SingleCoil(object):
@@ -10,6 +372,10 @@ class SingleCoil(object):
     ----------
     x: Data in x-coordinate
 
+    The segment geometry (`xyz`, `dl`, `midpoints`, `lengths`, `tangents`) is computed
+    lazily and cached. The cache is cleared when `x, y, z` are reassigned or modified
+    by `interpolate` and `magnify`. Call `clear_cache` after modifying them in place.
+
     Args:
         x (list, optional): Data in x-coordinate. Defaults to [].
         y (list, optional): Data in y-coordinate. Defaults to [].
@@ -21,91 +387,202 @@ class SingleCoil(object):
 
     def __init__(self, x=[], y=[], z=[], I=0.0, name="coil1", group=1):
         assert len(x) == len(y) == len(z), "dimension not consistent"
+        self._cache = {}
+        # filaments keyed by (nw, nh, width, height, frame)
+        self._filaments = {}
         self.x = np.asarray(x)
         self.y = np.asarray(y)
         self.z = np.asarray(z)
         self.I = I
         self.name = name
         self.group = group
+        return
+
+    @property
+    def x(self):
+        """numpy.ndarray: Data in x-coordinate."""
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        self._x = np.asarray(value)
+        self.clear_cache()
+
+    @property
+    def y(self):
+        """numpy.ndarray: Data in y-coordinate."""
+        return self._y
+
+    @y.setter
+    def y(self, value):
+        self._y = np.asarray(value)
+        self.clear_cache()
+
+    @property
+    def z(self):
+        """numpy.ndarray: Data in z-coordinate."""
+        return self._z
+
+    @z.setter
+    def z(self, value):
+        self._z = np.asarray(value)
+        self.clear_cache()
+
+    def clear_cache(self):
+        """Clear the cached segment geometry, tangents and filaments."""
+        self._cache.clear()
+        self._filaments.clear()
         self.xt = None
         self.yt = None
         self.zt = None
         return
 
-    def bfield(self, pos):
-        """Calculate the magnetic field at an arbitrary point using `self.dt`.
+    def _clear_tangent_cache(self):
+        """Drop the cached values depending on the tangents xt, yt, zt."""
+        self._cache.pop("tangents", None)
+        self._filaments.clear()
+        return
+
+    def _cached(self, key, func):
+        if key not in self._cache:
+            self._cache[key] = func()
+        return self._cache[key]
+
+    @property
+    def xyz(self):
+        """numpy.ndarray: (n,3) coil points."""
+        return self._cached("xyz", lambda: np.transpose([self.x, self.y, self.z]))
+
+    @property
+    def dl(self):
+        """numpy.ndarray: (n-1,3) segment vectors."""
+        return self._cached("dl", lambda: np.diff(self.xyz, axis=0))
+
+    @property
+    def midpoints(self):
+        """numpy.ndarray: (n-1,3) segment midpoints."""
+        return self._cached("midpoints", lambda: (self.xyz[:-1] + self.xyz[1:]) / 2)
+
+    @property
+    def lengths(self):
+        """numpy.ndarray: (n-1,) segment lengths."""
+        return self._cached("lengths", lambda: np.linalg.norm(self.dl, axis=1))
+
+    @property
+    def tangents(self):
+        """numpy.ndarray: (n,3) derivatives dx/dt with t in [0, 2pi].
+
+        `fourier_tangent` is used for closed coils and `spline_tangent` otherwise,
+        unless one of them has been called explicitly.
+        """
+        if self.xt is None:
+            if np.allclose(self.xyz[0], self.xyz[-1]):
+                self.fourier_tangent()
+            else:
+                self.spline_tangent()
+        return self._cached(
+            "tangents", lambda: np.transpose([self.xt, self.yt, self.zt])
+        )
+
+    def _spectral_derivatives(self):
+        """First and second derivatives of a closed coil using FFT, shape (n,3) each."""
+
+        def derivatives():
+            from .misc import fft_deriv
+
+            assert np.allclose(self.xyz[0], self.xyz[-1]), "Coils should be closed."
+            rp = np.real(fft_deriv(self.xyz[:-1]))
+            rpp = np.real(fft_deriv(rp))
+            return np.concatenate((rp, rp[:1])), np.concatenate((rpp, rpp[:1]))
+
+        return self._cached("spectral", derivatives)
+
+    def bfield(self, pos, chunk_size=None, max_memory=None):
+        """Calculate the magnetic field at arbitrary points using `self.tangents`.
 
         Args:
-            pos (list): Evaluation point in Cartesian coordinates.
+            pos (array_like): Evaluation points in Cartesian coordinates, shape (3,) or (npos,3).
+            chunk_size (int, optional): Number of points evaluated at once. Defaults to None.
+            max_memory (int, optional): Memory budget in bytes if `chunk_size` is None. Defaults to None.
 
         Returns:
-            numpy.ndarray: B vector produced by the coil.
+            numpy.ndarray: B vector produced by the coil, shape (3,) or (npos,3).
         """
-        ob_pos = np.atleast_1d(pos)
-        dx = ob_pos[0] - self.x[:-1]
-        dy = ob_pos[1] - self.y[:-1]
-        dz = ob_pos[2] - self.z[:-1]
-        dr = dx * dx + dy * dy + dz * dz
-        Bx = (dz * self.yt[:-1] - dy * self.zt[:-1]) * np.power(dr, -1.5) * self.dt
-        By = (dx * self.zt[:-1] - dz * self.xt[:-1]) * np.power(dr, -1.5) * self.dt
-        Bz = (dy * self.xt[:-1] - dx * self.yt[:-1]) * np.power(dr, -1.5) * self.dt
-        B = np.array([np.sum(Bx), np.sum(By), np.sum(Bz)]) * u0_d_4pi * self.I
-        return B
-
-    def bfield_fd(self, pos):
-        """Calculate the magnetic field at an arbitrary point using finite difference.
+        ob_pos = np.atleast_2d(pos)
+        xt, yt, zt = self.tangents[:-1].T
+        B = np.zeros(ob_pos.shape)
+        for block in _point_blocks(
+            len(ob_pos), len(self.x) - 1, chunk_size, max_memory
+        ):
+            dx = ob_pos[block, 0:1] - self.x[np.newaxis, :-1]
+            dy = ob_pos[block, 1:2] - self.y[np.newaxis, :-1]
+            dz = ob_pos[block, 2:3] - self.z[np.newaxis, :-1]
+            dr = np.power(dx * dx + dy * dy + dz * dz, -1.5) * self.dt
+            B[block, 0] = np.sum((dz * yt - dy * zt) * dr, axis=1)
+            B[block, 1] = np.sum((dx * zt - dz * xt) * dr, axis=1)
+            B[block, 2] = np.sum((dy * xt - dx * yt) * dr, axis=1)
+        B *= u0_d_4pi * self.I
+        return B[0] if np.ndim(pos) == 1 else B
+
+    def bfield_fd(self, pos, chunk_size=None, max_memory=None):
+        """Calculate the magnetic field at arbitrary points using finite difference.
 
         Args:
-            pos (list): Evaluation point in Cartesian coordinates.
+            pos (array_like): Evaluation points in Cartesian coordinates, shape (3,) or (npos,3).
+            chunk_size (int, optional): Number of points evaluated at once. Defaults to None.
+            max_memory (int, optional): Memory budget in bytes if `chunk_size` is None. Defaults to None.
 
         Returns:
-            numpy.ndarray: B vector produced by the coil.
+            numpy.ndarray: B vector produced by the coil, shape (3,) or (npos,3).
         """
-        pos = np.atleast_1d(pos)
-        xt = self.x[1:] - self.x[:-1]
-        yt = self.y[1:] - self.y[:-1]
-        zt = self.z[1:] - self.z[:-1]
-        dx = pos[0] - (self.x[:-1] + self.x[1:]) / 2
-        dy = pos[1] - (self.y[:-1] + self.y[1:]) / 2
-        dz = pos[2] - (self.z[:-1] + self.z[1:]) / 2
-        dr = dx * dx + dy * dy + dz * dz
-        Bx = (dz * yt - dy * zt) * np.power(dr, -1.5)
-        By = (dx * zt - dz * xt) * np.power(dr, -1.5)
-        Bz = (dy * xt - dx * yt) * np.power(dr, -1.5)
-        B = np.array([np.sum(Bx), np.sum(By), np.sum(Bz)]) * u0_d_4pi * self.I
-        return B
-
-    def bfield_HH(self, pos, **kwargs):
-        """Calculate B field at an arbitrary point using the Hanson-Hirshman expression
+        ob_pos = np.atleast_2d(pos)
+        xt, yt, zt = self.dl.T
+        xm, ym, zm = self.midpoints.T
+        B = np.zeros(ob_pos.shape)
+        for block in _point_blocks(len(ob_pos), len(xt), chunk_size, max_memory):
+            dx = ob_pos[block, 0:1] - xm[np.newaxis, :]
+            dy = ob_pos[block, 1:2] - ym[np.newaxis, :]
+            dz = ob_pos[block, 2:3] - zm[np.newaxis, :]
+            dr = np.power(dx * dx + dy * dy + dz * dz, -1.5)
+            B[block, 0] = np.sum((dz * yt - dy * zt) * dr, axis=1)
+            B[block, 1] = np.sum((dx * zt - dz * xt) * dr, axis=1)
+            B[block, 2] = np.sum((dy * xt - dx * yt) * dr, axis=1)
+        B *= u0_d_4pi * self.I
+        return B[0] if np.ndim(pos) == 1 else B
+
+    def bfield_HH(self, pos, chunk_size=None, max_memory=None, **kwargs):
+        """Calculate B field at arbitrary points using the Hanson-Hirshman expression
+
+        The evaluation points are streamed in blocks, so that the peak memory is bounded
+        by `chunk_size` or `max_memory` while each block is fully vectorized.
 
         Arguments:
-            pos (list): Cartesian coordinates for the evaluation point.
+            pos (list): Cartesian coordinates for the evaluation points, shape (npos,3).
+            chunk_size (int, optional): Number of points evaluated at once. Defaults to None.
+            max_memory (int, optional): Memory budget in bytes if `chunk_size` is None. Defaults to None.
 
         Returns:
             numpy.ndarray: B vector produced by the coil.
         """
-        xyz = np.array([self.x, self.y, self.z]).T
+        xyz = self.xyz
         pos = np.atleast_2d(pos)
         assert (pos.shape)[1] == 3
-        Rvec = pos[:, np.newaxis, :] - xyz[np.newaxis, :, :]
-        assert (Rvec.shape)[-1] == 3
-        RR = np.linalg.norm(Rvec, axis=2)
-        Riv = Rvec[:, :-1, :]
-        Rfv = Rvec[:, 1:, :]
-        Ri = RR[:, :-1]
-        Rf = RR[:, 1:]
-        B = (
-            np.sum(
+        B = np.zeros(pos.shape)
+        for block in _point_blocks(len(pos), len(xyz), chunk_size, max_memory):
+            Rvec = pos[block, np.newaxis, :] - xyz[np.newaxis, :, :]
+            RR = np.linalg.norm(Rvec, axis=2)
+            Riv = Rvec[:, :-1, :]
+            Rfv = Rvec[:, 1:, :]
+            Ri = RR[:, :-1]
+            Rf = RR[:, 1:]
+            B[block] = np.sum(
                 np.cross(Riv, Rfv)
                 * ((Ri + Rf) / ((Ri * Rf) * (Ri * Rf + np.sum(Riv * Rfv, axis=2))))[
                     :, :, np.newaxis
                 ],
                 axis=1,
             )
-            * u0_d_4pi
-            * self.I
-        )
-        return B
+        return B * u0_d_4pi * self.I
 
     def hanson_hirshman(self, pos):
         """Wrapper for the fortran code biotsavart.hanson_hirshman
@@ -118,15 +595,26 @@ class SingleCoil(object):
         """
         from coilpy_fortran import hanson_hirshman
 
-        xyz = np.transpose([self.x, self.y, self.z])
-        return hanson_hirshman(pos, xyz, self.I)
+        return hanson_hirshman(pos, self.xyz, self.I)
+
+    def vector_potential(self, pos):
+        """Wrapper for the fortran code biotsavart.vector_potential
+
+        Args:
+            pos (ndarray, (n,3)): Evaluation points in space
+
+        Returns:
+            ndarray, (n,3): Vector potential at the evaluation point
+        """
+        from coilpy_fortran import vector_potential
+
+        return vector_potential(np.atleast_2d(pos), self.xyz, self.I)
 
     def biot_savart(self, pos):
         from coilpy_fortran import biot_savart
 
-        xyz = np.transpose([self.x, self.y, self.z])
-        dxyz = np.transpose([self.xt * self.dt, self.yt * self.dt, self.zt * self.dt])
-        return biot_savart(pos, xyz[:-1, :], self.I, dxyz[:-1, :])
+        dxyz = self.tangents * self.dt
+        return biot_savart(pos, self.xyz[:-1, :], self.I, dxyz[:-1, :])
 
     def fourier_tangent(self):
         """
@@ -145,6 +633,7 @@ class SingleCoil(object):
         self.xt = np.concatenate((self.xt, self.xt[0:1]))
         self.yt = np.concatenate((self.yt, self.yt[0:1]))
         self.zt = np.concatenate((self.zt, self.zt[0:1]))
+        self._clear_tangent_cache()
         return
 
     def spline_tangent(self, order=3, der=1):
@@ -167,6 +656,7 @@ class SingleCoil(object):
             self.xa = interpolate.splev(t, fx, der=2)
             self.ya = interpolate.splev(t, fy, der=2)
             self.za = interpolate.splev(t, fz, der=2)
+        self._clear_tangent_cache()
         return
 
     def interpolate(self, num=256, kind="fft", nf=-1):
@@ -183,9 +673,8 @@ class SingleCoil(object):
 
         cur_len = len(self.x)
         assert cur_len > 0
-        theta = np.linspace(0, 1, num=cur_len, endpoint=True)
-        theta_new = np.linspace(0, 1, num=num, endpoint=True)
         if kind == "fft":
+            theta_new = np.linspace(0, 2 * np.pi, num=num, endpoint=True)
             # FFT
             fftxy = trigfft(self.x[:-1] + 1j * self.y[:-1], tr=nf)
             fftz = trigfft(self.z[:-1], tr=nf)
@@ -201,6 +690,8 @@ class SingleCoil(object):
             self.z = trig2real(theta_new, zeta=None, xm=xm, xn=None, fmnc=zc, fmns=zs)
         else:
             # splines
+            theta = np.linspace(0, 1, num=cur_len, endpoint=True)
+            theta_new = np.linspace(0, 1, num=num, endpoint=True)
             f = interp1d(theta, self.x, kind="cubic")
             self.x = f(theta_new)
             f = interp1d(theta, self.y, kind="cubic")
@@ -209,38 +700,46 @@ class SingleCoil(object):
             self.z = f(theta_new)
         return
 
+    def transform(self, matrix=None, shift=None):
+        """Apply x -> matrix @ x + shift to the coil points in place.
+
+        Args:
+            matrix (array_like, optional): (3,3) transformation matrix. Defaults to None.
+            shift (array_like, optional): (3,) translation. Defaults to None.
+        """
+        xyz = np.transpose([self.x, self.y, self.z])
+        if matrix is not None:
+            xyz = xyz @ np.asarray(matrix, dtype=float).T
+        if shift is not None:
+            xyz = xyz + np.asarray(shift, dtype=float)
+        self.x[:], self.y[:], self.z[:] = np.transpose(xyz)
+        self.clear_cache()
+        return
+
+    def scale(self, factor, center=None):
+        """Scale the coil points about a center in place.
+
+        Args:
+            factor (float or array_like): Scaling factor, or (3,) factors along x, y, z.
+            center (array_like, optional): (3,) center of the scaling. Defaults to the origin.
+        """
+        factor = np.broadcast_to(np.asarray(factor, dtype=float), (3,))
+        center = np.zeros(3) if center is None else np.asarray(center, dtype=float)
+        self.transform(np.diag(factor), center - factor * center)
+        return
+
     def magnify(self, ratio):
-        """Magnify the coil with a ratio.
+        """Magnify the closed coil with a ratio about its centroid.
 
         Args:
             ratio (float): The magnifying ratio.
         """
-        # number of points
-        nseg = len(self.x)
-        # assuming closed curve; should be revised
-        if True:  # abs(self.x[0] - self.x[-1]) < 1.0E-8:
-            nseg -= 1
+        # number of points, assuming closed curve
+        nseg = len(self.x) - 1
         assert nseg > 1
-        # get centroid
-        centroid = np.array(
-            [
-                np.sum(self.x[0:nseg]) / nseg,
-                np.sum(self.y[0:nseg]) / nseg,
-                np.sum(self.z[0:nseg]) / nseg,
-            ]
-        )
-        # magnify
-        for i in range(nseg):
-            xyz = np.array([self.x[i], self.y[i], self.z[i]])
-            dr = xyz - centroid
-            [self.x[i], self.y[i], self.z[i]] = centroid + ratio * dr
-        try:
-            self.x[nseg] = self.x[0]
-            self.y[nseg] = self.y[0]
-            self.z[nseg] = self.z[0]
-            return
-        except ValueError:
-            return
+        self.scale(ratio, center=np.mean(self.xyz[:nseg], axis=0))
+        self.x[nseg], self.y[nseg], self.z[nseg] = self.x[0], self.y[0], self.z[0]
+        return
 
     def plot(self, engine="mayavi", fig=None, ax=None, show=True, **kwargs):
         """Plot the coil in a specified engine.
@@ -339,112 +838,107 @@ class SingleCoil(object):
             raise ValueError("Invalid engine option {pyplot, mayavi, plotly}")
         return
 
-    def rectangle(self, width=0.1, height=0.1, frame="centroid", **kwargs):
-        """Expand single coil filament to a finite-build coil.
+    def frame(self, frame="centroid", **kwargs):
+        """Orthonormal frame along the coil used for the finite build.
 
         Args:
-            width (float, optional): Coil width. Defaults to 0.1.
-            height (float, optional): Coil height. Defaults to 0.1.
             frame (str, optional): Finite-build frame, could be one of
                                   ("centroid", "frenet", "parallel"). Defaults to "centroid".
 
         Returns:
-            numpy.ndarry: x-coordiante for plotting as a mesh.
-            numpy.ndarry: y-coordiante for plotting as a mesh.
-            numpy.ndarry: z-coordiante for plotting as a mesh.
+            numpy.ndarray: (n,3) unit tangent.
+            numpy.ndarray: (n,3) unit normal, the direction of the coil height.
+            numpy.ndarray: (n,3) unit bi-normal, the direction of the coil width.
         """
         n = np.size(self.x)
-        # calculate the tangent
-        if self.xt is None:
-            self.spline_tangent()
-        xt = self.xt
-        yt = self.yt
-        zt = self.zt
-        # dt = 2 * np.pi / (n - 1)
-        # xt = np.gradient(self.x)/dt
-        # yt = np.gradient(self.y)/dt
-        # zt = np.gradient(self.z)/dt
-        tt = np.sqrt(xt * xt + yt * yt + zt * zt)
-        xt = xt / tt
-        yt = yt / tt
-        zt = zt / tt
-
+        tangent = self._unit_tangent()
         # use surface normal if needed
         if frame == "centroid":
             # use the geometry center is a good idea
-            center_x = np.average(self.x[0 : n - 1])
-            center_y = np.average(self.y[0 : n - 1])
-            center_z = np.average(self.z[0 : n - 1])
-            xn = self.x - center_x
-            yn = self.y - center_y
-            zn = self.z - center_z
-            nt = xn * xt + yn * yt + zn * zt
-            xn = xn - nt * xt
-            yn = yn - nt * yt
-            zn = zn - nt * zt
+            normal = self.xyz - np.average(self.xyz[0 : n - 1], axis=0)
         elif frame == "frenet":
             self.spline_tangent(der=2)
-            xn = self.xa
-            yn = self.ya
-            zn = self.za
+            normal = np.transpose([self.xa, self.ya, self.za])
         elif frame == "parallel":
-            # parallel transport frame
-            # Hanson & Ma, Parallel Transp ort Approach to Curve Framing, 1995
-            def rotate(x, ang):
-                c = np.cos(ang)
-                s = np.sin(ang)
-                return [
-                    [
-                        c + x[0] ** 2 * (1 - c),
-                        x[0] * x[1] * (1 - c) - s * x[2],
-                        x[2] * x[0] * (1 - c) + s * x[1],
-                    ],
-                    [
-                        x[0] * x[1] * (1 - c) + s * x[2],
-                        c + x[1] ** 2 * (1 - c),
-                        x[2] * x[1] * (1 - c) - s * x[0],
-                    ],
-                    [
-                        x[0] * x[2] * (1 - c) - s * x[1],
-                        x[1] * x[2] * (1 - c) + s * x[0],
-                        c + x[2] ** 2 * (1 - c),
-                    ],
-                ]
-
-            T = np.transpose([self.xt, self.yt, self.zt])
-            T = T / np.linalg.norm(T, axis=1)[:, np.newaxis]
-            B = np.cross(T[:-1], T[1:], axis=1)
-            B = B / np.linalg.norm(B, axis=1)[:, np.newaxis]
-            theta = np.arccos(np.sum(T[:-1] * T[1:], axis=1))
-            V = np.zeros_like(T)
-            kwargs.setdefault("vx", self.x[0] - np.average(self.x[0:-1]))
-            kwargs.setdefault("vy", self.y[0] - np.average(self.y[0:-1]))
-            vx = kwargs["vx"]
-            vy = kwargs["vy"]
-            vz = -(vx * T[0, 0] + vy * T[0, 1]) / T[0, 2]
-            vv = np.linalg.norm([vx, vy, vz])
-            V[0, :] = [vx / vv, vy / vv, vz / vv]
-            print(np.dot(V[0, :], T[0, :]))
-            for i in range(len(theta)):
-                V[i + 1, :] = rotate(B[i, :], theta[i]) @ V[i, :]
-            xn = V[:, 0]
-            yn = V[:, 1]
-            zn = V[:, 2]
+            normal = _parallel_transport(
+                tangent, [self._parallel_start(tangent, **kwargs)], [0, n]
+            )
         else:
-            assert True, "not finished"
-
-        nn = np.sqrt(xn * xn + yn * yn + zn * zn)
-        xn = xn / nn
-        yn = yn / nn
-        zn = zn / nn
-        # calculate the bi-normal
-        xb = yt * zn - yn * zt
-        yb = zt * xn - zn * xt
-        zb = xt * yn - xn * yt
-        bb = np.sqrt(xb * xb + yb * yb + zb * zb)
-        xb = xb / bb
-        yb = yb / bb
-        zb = zb / bb
+            raise ValueError("Invalid frame option {centroid, frenet, parallel}")
+        return _orthonormal_frame(tangent, normal)
+
+    def _unit_tangent(self):
+        """(n,3) unit tangent, using spline tangents if xt, yt, zt are not computed yet."""
+        if self.xt is None:
+            self.spline_tangent()
+        tangent = np.transpose([self.xt, self.yt, self.zt])
+        return tangent / np.linalg.norm(tangent, axis=1)[:, np.newaxis]
+
+    def _parallel_start(self, tangent, vx=None, vy=None):
+        """Initial normal of the parallel transport frame, perpendicular to the first tangent.
+
+        Args:
+            tangent (numpy.ndarray): (n,3) unit tangent.
+            vx (float, optional): x component of the initial normal. Defaults to x[0] - the centroid.
+            vy (float, optional): y component of the initial normal. Defaults to y[0] - the centroid.
+
+        Returns:
+            numpy.ndarray: (3,) unit normal at the first point.
+        """
+        if vx is None:
+            vx = self.x[0] - np.average(self.x[0:-1])
+        if vy is None:
+            vy = self.y[0] - np.average(self.y[0:-1])
+        vz = -(vx * tangent[0, 0] + vy * tangent[0, 1]) / tangent[0, 2]
+        v0 = np.array([vx, vy, vz])
+        return v0 / np.linalg.norm(v0)
+
+    def filaments(self, nw=2, nh=2, width=0.1, height=0.1, frame="centroid"):
+        """Expand the coil into a bundle of nw*nh filaments over a rectangular cross-section.
+
+        The filaments sit at the centers of the nw*nh sub-rectangles. The result is
+        cached until the coil geometry changes.
+
+        Args:
+            nw (int, optional): Number of filaments along the width. Defaults to 2.
+            nh (int, optional): Number of filaments along the height. Defaults to 2.
+            width (float, optional): Coil width. Defaults to 0.1.
+            height (float, optional): Coil height. Defaults to 0.1.
+            frame (str, optional): Finite-build frame, see `SingleCoil.frame`. Defaults to "centroid".
+
+        Returns:
+            numpy.ndarray: (nw*nh,n,3) xyz points of the filaments.
+        """
+
+        def expand():
+            _, normal, binormal = self.frame(frame)
+            u = width * ((np.arange(nw) + 0.5) / nw - 0.5)
+            v = height * ((np.arange(nh) + 0.5) / nh - 0.5)
+            u, v = [np.ravel(a)[:, np.newaxis, np.newaxis] for a in np.meshgrid(u, v)]
+            return self.xyz + u * binormal + v * normal
+
+        key = (nw, nh, width, height, frame)
+        if key not in self._filaments:
+            self._filaments[key] = expand()
+        return self._filaments[key]
+
+    def rectangle(self, width=0.1, height=0.1, frame="centroid", **kwargs):
+        """Expand single coil filament to a finite-build coil.
+
+        Args:
+            width (float, optional): Coil width. Defaults to 0.1.
+            height (float, optional): Coil height. Defaults to 0.1.
+            frame (str, optional): Finite-build frame, could be one of
+                                  ("centroid", "frenet", "parallel"). Defaults to "centroid".
+
+        Returns:
+            numpy.ndarry: x-coordiante for plotting as a mesh.
+            numpy.ndarry: y-coordiante for plotting as a mesh.
+            numpy.ndarry: z-coordiante for plotting as a mesh.
+        """
+        _, normal, binormal = self.frame(frame, **kwargs)
+        xn, yn, zn = np.transpose(normal)
+        xb, yb, zb = np.transpose(binormal)
         # get the boundary lines
         z1 = self.z - width / 2 * zb + height / 2 * zn
         x1 = self.x - width / 2 * xb + height / 2 * xn
@@ -480,7 +974,7 @@ class SingleCoil(object):
             np.array(self.y),
             np.array(self.z),
             np.array([len(self.x)]),
-            **kwargs
+            **kwargs,
         )
         return
 
@@ -495,6 +989,8 @@ class Coil(object):
         II (list, optional): Coil currents. Defaults to [[]].
         names (list, optional): Coil names. Defaults to [[]].
         groups (list, optional): Coil groups. Defaults to [[]].
+        nfp (int, optional): Number of field periods of a symmetric coil set. Defaults to 1.
+        stellsym (bool, optional): Stellarator symmetry of a symmetric coil set. Defaults to False.
 
     A convenient way for construction is to use `self.read_makegrid(filename)`, like
 
@@ -503,17 +999,32 @@ class Coil(object):
         ``
 
     Each coil is stored in `self.data` in the format of `coilpy.coils.SingleCoil`.
+    The points of all the coils are stored contiguously in `self.xyz` (with `self.offsets`),
+    and the `x, y, z` arrays of each `SingleCoil` are zero-copy views into it.
+    Coils whose arrays are reassigned (e.g. by `SingleCoil.interpolate`) are repacked
+    automatically the next time the packed arrays are used.
 
     You can plot the coilset using `self.plot`.
 
     The coilset can be saved in the format of MAKEGRID using `self.save_makegrid`
     and saved as VTK files using `self.toVTK`.
+
+    If `nfp` > 1 or `stellsym` is True, `self.data` only holds the unique coils and the
+    full coil set is implied by the symmetry (see `self.unique` and `self.unfold`).
+    The field is then computed by rotating and reflecting the evaluation points rather
+    than the coils.
     """
 
-    def __init__(self, xx=[], yy=[], zz=[], II=[], names=[], groups=[]):
+    def __init__(
+        self, xx=[], yy=[], zz=[], II=[], names=[], groups=[], nfp=1, stellsym=False
+    ):
         assert (
             len(xx) == len(yy) == len(zz) == len(II) == len(names) == len(groups)
         ), "dimension not consistent"
+        self.nfp = nfp
+        self.stellsym = stellsym
+        # the `periods` value in the MAKEGRID header
+        self.periods = nfp
         self.num = len(xx)
         self.data = []
         for i in range(self.num):
@@ -522,23 +1033,188 @@ class Coil(object):
                     x=xx[i], y=yy[i], z=zz[i], I=II[i], name=names[i], group=groups[i]
                 )
             )
-        self.index = 0
+        self.pack()
         return
 
-    def __iter__(self):
-        return self
+    @classmethod
+    def from_fourier(cls, fourier, num=128):
+        """Discretize Fourier coils, with the exact tangents stored in xt, yt, zt.
 
-    def __next__(self):
-        if self.index < self.num:
-            self.index += 1
-            return self.data[self.index - 1]
-        else:
-            self.index = 0
-            raise StopIteration()
+        Args:
+            fourier (FourierCoil): The Fourier coils.
+            num (int, optional): Number of segments of each coil. Defaults to 128.
+
+        Returns:
+            Coil: The coil set, each coil with num+1 points.
+        """
+        xyz = fourier.evaluate(num)
+        coil = cls.from_packed(
+            np.asfortranarray(xyz.reshape(-1, 3)),
+            np.arange(0, fourier.num * (num + 1) + 1, num + 1),
+            fourier.currents,
+            fourier.groups,
+            fourier.names,
+            nfp=fourier.nfp,
+            stellsym=fourier.stellsym,
+        )
+        for icoil, tangent in zip(coil.data, fourier.evaluate(num, der=1)):
+            icoil.xt, icoil.yt, icoil.zt = np.transpose(tangent)
+            icoil.dt = 2 * np.pi / num
+        return coil
+
+    @classmethod
+    def read_focus(cls, filename, nfp=None, num=128):
+        """Read and discretize the Fourier coils in a FOCUS coil file, see `FourierCoil.read_focus`.
+
+        Args:
+            filename (str): Path of the FOCUS coil file.
+            nfp (int, optional): Number of field periods of the symmetric coils. Defaults to None.
+            num (int, optional): Number of segments of each coil. Defaults to 128.
+
+        Returns:
+            Coil: The coil set, each coil with num+1 points.
+        """
+        return cls.from_fourier(FourierCoil.read_focus(filename, nfp), num=num)
+
+    @classmethod
+    def from_packed(cls, xyz, offsets, currents, groups, names, nfp=1, stellsym=False):
+        """Construct a coil set from packed arrays without copying the coordinates.
+
+        Args:
+            xyz (numpy.ndarray): (npoints,3) xyz points of all the coils, one after another.
+            offsets (numpy.ndarray): (ncoils+1,) starting index of each coil, the last one is npoints.
+            currents (numpy.ndarray): (ncoils,) coil currents.
+            groups (numpy.ndarray): (ncoils,) coil groups.
+            names (list): (ncoils,) coil names.
+            nfp (int, optional): Number of field periods of a symmetric coil set. Defaults to 1.
+            stellsym (bool, optional): Stellarator symmetry of a symmetric coil set. Defaults to False.
+
+        Returns:
+            Coil: The coil set whose coils are views into `xyz`.
+        """
+        coil = cls(nfp=nfp, stellsym=stellsym)
+        coil.data = [
+            SingleCoil(I=I, name=name, group=group)
+            for I, name, group in zip(currents, names, groups)
+        ]
+        coil.num = len(coil.data)
+        assert len(offsets) == coil.num + 1, "dimension not consistent"
+        coil._attach(np.asarray(xyz, dtype=float), np.asarray(offsets, dtype=int))
+        return coil
+
+    def _attach(self, xyz, offsets):
+        """Point the x, y, z arrays of each coil to the packed storage."""
+        self._xyz = xyz
+        self._offsets = offsets
+        self._views = []
+        for i, icoil in enumerate(self.data):
+            # same values, so the cached geometry of the coil stays valid
+            icoil._x = xyz[offsets[i] : offsets[i + 1], 0]
+            icoil._y = xyz[offsets[i] : offsets[i + 1], 1]
+            icoil._z = xyz[offsets[i] : offsets[i + 1], 2]
+            self._views.append((icoil.x, icoil.y, icoil.z))
+        return
+
+    def _is_packed(self):
+        """Check if all the coils are still views into the packed storage."""
+        if len(self.data) != len(self._views):
+            return False
+        for icoil, (x, y, z) in zip(self.data, self._views):
+            if not (icoil.x is x and icoil.y is y and icoil.z is z):
+                return False
+            if not np.may_share_memory(x, self._xyz):
+                return False
+        return True
+
+    def pack(self):
+        """(Re)pack the points of all the coils into one contiguous array."""
+        self.num = len(self.data)
+        lengths = [len(icoil.x) for icoil in self.data]
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(int)
+        xyz = np.zeros((offsets[-1], 3), order="F")
+        for i, icoil in enumerate(self.data):
+            xyz[offsets[i] : offsets[i + 1], 0] = icoil.x
+            xyz[offsets[i] : offsets[i + 1], 1] = icoil.y
+            xyz[offsets[i] : offsets[i + 1], 2] = icoil.z
+        self._attach(xyz, offsets)
+        return
+
+    @property
+    def xyz(self):
+        """numpy.ndarray: (npoints,3) xyz points of all the coils, one after another."""
+        if not self._is_packed():
+            self.pack()
+        return self._xyz
+
+    @property
+    def offsets(self):
+        """numpy.ndarray: (ncoils+1,) starting index of each coil in `self.xyz`."""
+        if not self._is_packed():
+            self.pack()
+        return self._offsets
+
+    @property
+    def currents(self):
+        """numpy.ndarray: (ncoils,) coil currents."""
+        return np.array([icoil.I for icoil in self.data], dtype=float)
+
+    @currents.setter
+    def currents(self, value):
+        assert len(value) == len(self.data), "dimension not consistent"
+        for icoil, I in zip(self.data, value):
+            icoil.I = I
+
+    @property
+    def groups(self):
+        """numpy.ndarray: (ncoils,) coil groups."""
+        return np.array([icoil.group for icoil in self.data])
+
+    @groups.setter
+    def groups(self, value):
+        assert len(value) == len(self.data), "dimension not consistent"
+        for icoil, group in zip(self.data, value):
+            icoil.group = group
+
+    @property
+    def names(self):
+        """numpy.ndarray: (ncoils,) coil names."""
+        return np.array([icoil.name for icoil in self.data])
+
+    @names.setter
+    def names(self, value):
+        assert len(value) == len(self.data), "dimension not consistent"
+        for icoil, name in zip(self.data, value):
+            icoil.name = name
+
+    def __iter__(self):
+        return iter(self.data)
 
     def __len__(self):
         return self.num
 
+    def __getitem__(self, key):
+        """Get a coil by index, or a new coil set by slice, index list or boolean mask.
+
+        Example:
+            ``coil[coil.groups == 2]`` returns the coils in group 2.
+        """
+        if isinstance(key, (int, np.integer)):
+            return self.data[key]
+        index = np.arange(len(self.data))[key]
+        xyz, offsets = self.xyz, self.offsets
+        lengths = np.diff(offsets)[index]
+        return Coil.from_packed(
+            np.concatenate(
+                [np.empty((0, 3))] + [xyz[offsets[i] : offsets[i + 1]] for i in index]
+            ),
+            np.concatenate(([0], np.cumsum(lengths))),
+            self.currents[index],
+            self.groups[index],
+            self.names[index],
+            nfp=self.nfp,
+            stellsym=self.stellsym,
+        )
+
     def __add__(self, other):
         """Join two coil sets.
 
@@ -550,18 +1226,46 @@ class Coil(object):
         """
         from copy import deepcopy
 
+        if (self.nfp, self.stellsym) != (other.nfp, other.stellsym):
+            raise ValueError("Cannot join coil sets with different symmetries.")
         total = deepcopy(self)
-        total.num += other.num
-        total.data += other.data
-        total.index = 0
+        total.data += deepcopy(other.data)
+        total.pack()
         return total
 
+    @classmethod
+    def iter_makegrid(cls, filename, group=None, name=None, chunk_size=2**22):
+        """Iterate over the coils in a MAKEGRID file without reading the whole file.
+
+        The file is parsed in chunks of `chunk_size` bytes and the header is skipped, use
+        `Coil.read_makegrid` to get it in `coil.header`. Each chunk is converted by a single
+        `np.fromstring` call, which takes most of the time, so the speedup over a
+        line-by-line reader is about 2x rather than an order of magnitude.
+
+        Args:
+            filename (str): file path and name, could be a gzip file (*.gz) or a file object
+                            opened in binary mode.
+            group (int or list, optional): Only yield the coils in these groups. Defaults to None.
+            name (str or list, optional): Only yield the coils with these names. Defaults to None.
+            chunk_size (int, optional): Number of bytes parsed at once. Defaults to 2**22.
+
+        Yields:
+            SingleCoil: The coils one by one.
+        """
+        with _open_file(filename, "rb") as coilfile:
+            for _ in range(3):
+                coilfile.readline()
+            yield from _makegrid_singlecoils(coilfile, group, name, chunk_size)
+
     @classmethod
     def read_makegrid(cls, filename):
         """Read coils from the MAKEGRID format.
 
+        The three header lines are kept in `coil.header`.
+
         Args:
-            filename (str): file path and name
+            filename (str): file path and name, could be a gzip file (*.gz) or a file object
+                            opened in binary mode.
 
         Raises:
             IOError: Check if file exists
@@ -572,53 +1276,90 @@ class Coil(object):
         import os
 
         # check existence
-        if not os.path.exists(filename):
+        if isinstance(filename, (str, os.PathLike)) and not os.path.exists(filename):
             raise IOError("File not existed. Please check again!")
-        # read and parse data
-        cls.header = ""
-        with open(filename, "r") as coilfile:  # read coil xyz and I
-            cls.header = "".join(
+        coil = cls()
+        with _open_file(filename, "rb") as coilfile:
+            coil.header = b"".join(
                 (coilfile.readline(), coilfile.readline(), coilfile.readline())
+            ).decode()
+            coil.data = list(_makegrid_singlecoils(coilfile))
+        coil.pack()
+        try:
+            coil.periods = int(coil.header.split()[1])
+        except (IndexError, ValueError):
+            pass
+        return coil
+
+    def save_binary(self, filename):
+        """Save the coil set into a HDF5 file with the packed arrays.
+
+        The file contains the contiguous datasets "xyz" (3,npoints), "offsets", "currents",
+        "groups" and "names", with the attributes "nfp", "stellsym" and "periods".
+
+        Args:
+            filename (str): File name and path.
+        """
+        import h5py
+
+        with h5py.File(filename, "w") as f:
+            f.attrs["format"] = "coilpy.Coil"
+            f.attrs["nfp"] = self.nfp
+            f.attrs["stellsym"] = self.stellsym
+            f.attrs["periods"] = self.periods
+            f.create_dataset("xyz", data=np.ascontiguousarray(self.xyz.T))
+            f.create_dataset("offsets", data=self.offsets)
+            f.create_dataset("currents", data=self.currents)
+            f.create_dataset("groups", data=self.groups)
+            f.create_dataset(
+                "names",
+                data=[str(name) for name in self.names],
+                dtype=h5py.string_dtype(),
             )
-            icoil = 0
-            xx = [[]]
-            yy = [[]]
-            zz = [[]]
-            II = []
-            names = []
-            groups = []
-            tmpI = 0.0
-            for line in coilfile:
-                linelist = line.split()
-                if len(linelist) < 4:
-                    # print("End of file or invalid format!")
-                    break
-                xx[icoil].append(float(linelist[0]))
-                yy[icoil].append(float(linelist[1]))
-                zz[icoil].append(float(linelist[2]))
-                if len(linelist) == 4:
-                    tmpI = float(linelist[-1])
-                if len(linelist) > 4:
-                    II.append(tmpI)
-                    try:
-                        group = int(linelist[4])
-                    except ValueError:
-                        group = len(groups) + 1
-                    groups.append(group)
-                    try:
-                        name = linelist[5]
-                    except IndexError:
-                        name = "coil"
-                    names.append(name)
-                    icoil = icoil + 1
-                    xx.append([])
-                    yy.append([])
-                    zz.append([])
-        xx.pop()
-        yy.pop()
-        zz.pop()
-        # print(len(xx) , len(yy) , len(zz) , len(II) , len(names) , len(groups))
-        return cls(xx=xx, yy=yy, zz=zz, II=II, names=names, groups=groups)
+        return
+
+    @classmethod
+    def load_binary(cls, filename, mmap=False):
+        """Load a coil set saved by `Coil.save_binary`.
+
+        Args:
+            filename (str): File name and path.
+            mmap (bool, optional): Memory-map the coordinates copy-on-write instead of reading
+                                   them, so that large files open instantly and unmodified
+                                   pages are shared between processes. The coils can still
+                                   be modified, but the changes are never written back to
+                                   the file. Defaults to False.
+
+        Returns:
+            Coil: The coil set.
+        """
+        import h5py
+
+        with h5py.File(filename, "r") as f:
+            dset = f["xyz"]
+            offset = dset.id.get_offset() if mmap else None
+            if offset is None:
+                # not requested, or no contiguous data in the file
+                xyz = dset[()]
+            else:
+                xyz = np.memmap(
+                    filename,
+                    dtype=dset.dtype,
+                    mode="c",
+                    offset=offset,
+                    shape=dset.shape,
+                )
+            coil = cls.from_packed(
+                xyz.T,
+                f["offsets"][()],
+                f["currents"][()],
+                f["groups"][()],
+                f["names"].asstr()[()],
+                nfp=int(f.attrs["nfp"]),
+                stellsym=bool(f.attrs["stellsym"]),
+            )
+            coil.periods = int(f.attrs["periods"])
+        return coil
 
     @classmethod
     def read_gpec_coils(cls, filename, current=1.0):
@@ -647,34 +1388,267 @@ class Coil(object):
         groups = range(1, ncoil + 1)
         return cls(xx=xx, yy=yy, zz=zz, II=II, names=names, groups=groups)
 
-    def plot(
-        self,
-        irange=[],
-        engine="pyplot",
-        plot2d=False,
-        ax=None,
-        fig=None,
-        show=True,
-        **kwargs
-    ):
-        """Plot coils in mayavi or matplotlib or plotly.
+    def _symmetry_ops(self):
+        """Transformations mapping the stored coils to the full coil set.
 
-        Args:
-            irange (list, optional): Coil list to be plotted. Defaults to [].
-            engine (string, optional): Plotting engine. One of {'pyplot', 'mayavi', 'plotly'}. Defaults to "pyplot".
-            plot2d (bool, optional): If plotting with finite size. Defaults to False.
-            fig (, optional): figure to be plotted on. Defaults to None.
-            ax (, optional): axis to be plotted on. Defaults to None.
-            show (bool, optional): if show the plotly figure immediately. Defaults to True.
-            kwargs (dict, optional): Keyword dict for plotting settings.
+        Returns:
+            list: (matrix, sign) pairs, the image of a coil is `matrix @ xyz` carrying
+                  `sign * I`. The first one is the identity.
         """
-        if len(irange) == 0:
-            irange = range(self.num)
-        if engine == "pyplot":
-            import matplotlib.pyplot as plt
+        ops = []
+        mirror = np.diag([1.0, -1.0, -1.0])
+        for ip in range(self.nfp):
+            phi = 2 * np.pi * ip / self.nfp
+            rotate = np.array(
+                [
+                    [np.cos(phi), -np.sin(phi), 0],
+                    [np.sin(phi), np.cos(phi), 0],
+                    [0, 0, 1],
+                ]
+            )
+            ops.append((rotate, 1.0))
+            if self.stellsym:
+                # stellarator symmetry: (x, y, z) -> (x, -y, -z) with reversed current
+                ops.append((rotate @ mirror, -1.0))
+        return ops
 
-            # plot in matplotlib.pyplot
-            if ax is None or ax.name != "3d":
+    def _symmetric_sum(self, pos, func):
+        """Sum the field of all the symmetric images by transforming the evaluation points.
+
+        Args:
+            pos (numpy.ndarray): (npos,3) evaluation points.
+            func (callable): Field of the stored coils at (n,3) points, returning (n,3) vectors
+                             or a tuple of (n,3) vectors and (n,3,3) gradients.
+
+        Returns:
+            Same as `func`, the field of the full coil set.
+        """
+        ops = self._symmetry_ops()
+        if len(ops) == 1:
+            return func(pos)
+        npos = len(pos)
+        res = func(np.concatenate([pos @ T for T, _ in ops]))
+        out = []
+        for data in res if isinstance(res, tuple) else (res,):
+            data = np.reshape(data, (len(ops), npos) + np.shape(data)[1:])
+            total = np.zeros(data.shape[1:])
+            for i, (T, sign) in enumerate(ops):
+                if data.ndim == 3:
+                    total += sign * data[i] @ T.T
+                else:
+                    total += sign * T @ data[i] @ T.T
+            out.append(total)
+        return tuple(out) if isinstance(res, tuple) else out[0]
+
+    def unfold(self):
+        """Expand a symmetric coil set into the full coil set.
+
+        Returns:
+            Coil: The full coil set, ordered as each unique coil followed by its images.
+        """
+        coil = self.replicate_periods(self.nfp, self.stellsym)
+        coil.periods = self.nfp if self.nfp > 1 or self.stellsym else self.periods
+        return coil
+
+    def replicate_periods(self, nfp, stellsym=False):
+        """Replicate all the coils to the full torus.
+
+        Args:
+            nfp (int): Number of field periods, coils are rotated by 2*pi/nfp about the z-axis.
+            stellsym (bool, optional): Also add the stellarator-symmetric images,
+                                       (x, y, z) -> (x, -y, -z) with reversed currents.
+                                       Defaults to False.
+
+        Returns:
+            Coil: The full coil set, ordered as each coil followed by its images.
+        """
+        ops = Coil(nfp=nfp, stellsym=stellsym)._symmetry_ops()
+        nops = len(ops)
+        xyz, offsets = self.xyz, self.offsets
+        lengths = np.diff(offsets)
+        # images of all the points, (nops, npoints, 3)
+        images = np.einsum("mij,nj->mni", np.array([T for T, _ in ops]), xyz)
+        # reorder as each coil followed by its images
+        source = (
+            np.arange(nops)[np.newaxis, :] * len(xyz) + offsets[:-1, np.newaxis]
+        ).ravel()
+        counts = np.repeat(lengths, nops)
+        target = np.concatenate(([0], np.cumsum(counts)))
+        index = np.repeat(source - target[:-1], counts) + np.arange(target[-1])
+        signs = np.array([sign for _, sign in ops])
+        return Coil.from_packed(
+            np.asfortranarray(images.reshape(-1, 3)[index]),
+            target,
+            (self.currents[:, np.newaxis] * signs).ravel(),
+            np.repeat(self.groups, nops),
+            np.repeat(self.names, nops),
+        )
+
+    def mirror(self):
+        """Stellarator-symmetric images of the coils, (x, y, z) -> (x, -y, -z) with reversed currents.
+
+        Returns:
+            Coil: The mirrored coil set.
+        """
+        coil = self[:]
+        coil.transform(np.diag([1.0, -1.0, -1.0]))
+        coil.currents = -coil.currents
+        return coil
+
+    def transform(self, matrix=None, shift=None):
+        """Apply x -> matrix @ x + shift to all the coil points in place.
+
+        The symmetry of a symmetric coil set is always about the z-axis.
+
+        Args:
+            matrix (array_like, optional): (3,3) transformation matrix. Defaults to None.
+            shift (array_like, optional): (3,) translation. Defaults to None.
+
+        Returns:
+            Coil: The coil set itself.
+        """
+        xyz = self.xyz
+        if matrix is not None:
+            xyz[:] = xyz @ np.asarray(matrix, dtype=float).T
+        if shift is not None:
+            xyz += np.asarray(shift, dtype=float)
+        for icoil in self.data:
+            icoil.clear_cache()
+        return self
+
+    def scale(self, factor, center=None):
+        """Scale all the coil points about a center in place.
+
+        Args:
+            factor (float or array_like): Scaling factor, or (3,) factors along x, y, z.
+            center (array_like, optional): (3,) center of the scaling. Defaults to the origin.
+
+        Returns:
+            Coil: The coil set itself.
+        """
+        factor = np.broadcast_to(np.asarray(factor, dtype=float), (3,))
+        center = np.zeros(3) if center is None else np.asarray(center, dtype=float)
+        return self.transform(np.diag(factor), center - factor * center)
+
+    def interpolate(self, num=256, nf=-1):
+        """Resample all the closed coils with FFT, same as `SingleCoil.interpolate` with kind='fft'.
+
+        Args:
+            num (int, optional): The total number of points of each coil after interpolation. Defaults to 256.
+            nf (int, optional): Number of truncated Fourier modes. Defaults to -1.
+        """
+        xyz, offsets = self.xyz, self.offsets
+        lengths = np.diff(offsets)
+        resampled = np.empty((len(self.data), num, 3))
+        # coils with the same number of points are transformed together
+        for n in np.unique(lengths):
+            index = np.flatnonzero(lengths == n)
+            points = xyz[offsets[index, np.newaxis] + np.arange(n)]
+            resampled[index] = _resample_fft(points, num, nf)
+        self._attach(
+            np.asfortranarray(resampled.reshape(-1, 3)),
+            np.arange(0, len(self.data) * num + 1, num),
+        )
+        for icoil in self.data:
+            icoil.clear_cache()
+        return
+
+    def magnify(self, ratio):
+        """Magnify each closed coil about its centroid in place (see `SingleCoil.magnify`).
+
+        Args:
+            ratio (float): The magnifying ratio.
+
+        Returns:
+            Coil: The coil set itself.
+        """
+        for icoil in self.data:
+            icoil.magnify(ratio)
+        return self
+
+    def unique(self, nfp=None, stellsym=False, tol=1e-6):
+        """Reduce a full coil set to the unique coils under the symmetry.
+
+        Args:
+            nfp (int, optional): Number of field periods. Defaults to `self.periods`,
+                                 i.e. the `periods` header of a MAKEGRID file.
+            stellsym (bool, optional): Stellarator symmetry. Defaults to False.
+            tol (float, optional): Tolerance when matching the coordinates of the images. Defaults to 1e-6.
+
+        Raises:
+            ValueError: The coil set is not symmetric under the given symmetry.
+
+        Returns:
+            Coil: The symmetric coil set holding only the unique coils.
+        """
+        assert self.nfp == 1 and not self.stellsym, "Coil set is already symmetric."
+        if nfp is None:
+            nfp = self.periods
+        ops = Coil(nfp=nfp, stellsym=stellsym)._symmetry_ops()
+        xyz = [np.transpose([icoil.x, icoil.y, icoil.z]) for icoil in self.data]
+        matched = np.zeros(self.num, dtype=bool)
+        keep = []
+        for i, icoil in enumerate(self.data):
+            if matched[i]:
+                continue
+            matched[i] = True
+            keep.append(i)
+            for T, sign in ops[1:]:
+                image = xyz[i] @ T.T
+                if np.allclose(image, xyz[i], rtol=0, atol=tol):
+                    raise ValueError(
+                        "Coil {:} is mapped onto itself by the symmetry.".format(i)
+                    )
+                for j in np.flatnonzero(~matched):
+                    if xyz[j].shape != image.shape:
+                        continue
+                    if np.isclose(self.data[j].I, sign * icoil.I) and np.allclose(
+                        xyz[j], image, rtol=0, atol=tol
+                    ):
+                        break
+                    # the same image stored in the reversed direction
+                    if np.isclose(self.data[j].I, -sign * icoil.I) and np.allclose(
+                        xyz[j], image[::-1], rtol=0, atol=tol
+                    ):
+                        break
+                else:
+                    raise ValueError(
+                        "Symmetric image of coil {:} is not found.".format(i)
+                    )
+                matched[j] = True
+        coil = self[keep]
+        coil.nfp = coil.periods = nfp
+        coil.stellsym = stellsym
+        return coil
+
+    def plot(
+        self,
+        irange=[],
+        engine="pyplot",
+        plot2d=False,
+        ax=None,
+        fig=None,
+        show=True,
+        **kwargs
+    ):
+        """Plot coils in mayavi or matplotlib or plotly.
+
+        Args:
+            irange (list, optional): Coil list to be plotted. Defaults to [].
+            engine (string, optional): Plotting engine. One of {'pyplot', 'mayavi', 'plotly'}. Defaults to "pyplot".
+            plot2d (bool, optional): If plotting with finite size. Defaults to False.
+            fig (, optional): figure to be plotted on. Defaults to None.
+            ax (, optional): axis to be plotted on. Defaults to None.
+            show (bool, optional): if show the plotly figure immediately. Defaults to True.
+            kwargs (dict, optional): Keyword dict for plotting settings.
+        """
+        if len(irange) == 0:
+            irange = range(self.num)
+        if engine == "pyplot":
+            import matplotlib.pyplot as plt
+
+            # plot in matplotlib.pyplot
+            if ax is None or ax.name != "3d":
                 fig = plt.figure()
                 ax = fig.add_subplot(111, projection="3d")
         elif engine == "plotly":
@@ -696,27 +1670,37 @@ class Coil(object):
                 fig.show()
         return
 
-    def save_makegrid(self, filename, nfp=1, **kwargs):
+    def save_makegrid(self, filename, nfp=None, **kwargs):
         """Write coils in the MAKEGRID format.
 
+        A symmetric coil set is unfolded and all the coils are written.
+
         Args:
-            filename (str): File name and path.
-            nfp (int, optional): Number of toroidal periodicity. Defaults to 1.
+            filename (str): File name and path, could be a gzip file (*.gz) or a file object.
+            nfp (int, optional): Number of toroidal periodicity. Defaults to `self.nfp`
+                                 for symmetric coil sets, otherwise `self.periods`, i.e. the
+                                 `periods` header of a MAKEGRID file (1 if missing).
         """
         assert len(self) > 0
-        with open(filename, "w") as wfile:
+        coils = self
+        if self.nfp > 1 or self.stellsym:
+            coils = self.unfold()
+            if nfp is None:
+                nfp = self.nfp
+        if nfp is None:
+            nfp = getattr(self, "periods", 1)
+        with _open_file(filename, "w") as wfile:
             wfile.write("periods {:3d} \n".format(nfp))
             wfile.write("begin filament \n")
             wfile.write("mirror NIL \n")
-            for icoil in list(self):
+            for icoil in list(coils):
                 Nseg = len(icoil.x)  # number of segments;
                 assert Nseg > 1
-                for iseg in range(Nseg - 1):  # the last point match the first one;
-                    wfile.write(
-                        "{:15.7E} {:15.7E} {:15.7E} {:15.7E}\n".format(
-                            icoil.x[iseg], icoil.y[iseg], icoil.z[iseg], icoil.I
-                        )
-                    )
+                # the last point match the first one;
+                values = np.empty((Nseg - 1, 4))
+                values[:, :3] = icoil.xyz[:-1]
+                values[:, 3] = icoil.I
+                _write_rows(wfile, "%15.7E %15.7E %15.7E %15.7E\n", values)
                 wfile.write(
                     "{:15.7E} {:15.7E} {:15.7E} {:15.7E} {:} {:10} \n".format(
                         icoil.x[0], icoil.y[0], icoil.z[0], 0.0, icoil.group, icoil.name
@@ -730,9 +1714,21 @@ class Coil(object):
 
         Args:
             filename (str): path (if split==True) or file name to be saved.
+                            If split==False, could also be a gzip file (*.gz) or a file object.
             split (bool, optional): write each coil into a separate file. Defaults to True
             nw (integer, optional): number of windings. Defaults to 1.
+
+        A symmetric coil set is unfolded and all the coils are written. With split==True,
+        the images of a coil are named "<name>_<k>", k = 1, 2, ...
         """
+        if self.nfp > 1 or self.stellsym:
+            coils = self.unfold()
+            nops = len(self._symmetry_ops())
+            coils.names = [
+                "{:}_{:d}".format(name, i % nops + 1)
+                for i, name in enumerate(coils.names)
+            ]
+            return coils.save_gpec_coils(filename, split=split, nw=nw, **kwargs)
         if split:
             # write in independent files
             for icoil in list(self):
@@ -745,15 +1741,10 @@ class Coil(object):
                         "{:>5}{:>5}{:>5}{:8.2f}\n".format(ncoil, s, nsec, nw)
                     )  # the first line with periods
                     # write each coil x, y, z
-                    for i in range(len(icoil.x)):
-                        f.write(
-                            "{:13.4e}{:13.4e}{:13.4e}\n".format(
-                                icoil.x[i], icoil.y[i], icoil.z[i]
-                            )
-                        )
+                    _write_rows(f, "%13.4e%13.4e%13.4e\n", icoil.xyz)
         else:
             # write into one file
-            with open(filename, "w") as f:
+            with _open_file(filename, "w") as f:
                 # write the defining parameters
                 ncoil = len(self)
                 s = 1  # have to assume this?
@@ -762,16 +1753,12 @@ class Coil(object):
                     "{:>5}{:>5}{:>5}{:8.2f}\n".format(ncoil, s, nsec, nw)
                 )  # the first line with periods
                 # write each coil x, y, z
-                for icoil in list(self):
-                    for i in range(len(icoil.x)):
-                        f.write(
-                            "{:13.4e}{:13.4e}{:13.4e}\n".format(
-                                icoil.x[i], icoil.y[i], icoil.z[i]
-                            )
-                        )
+                _write_rows(f, "%13.4e%13.4e%13.4e\n", self.xyz)
         return
 
-    def toVTK(self, vtkname, line=True, height=0.1, width=0.1, **kwargs):
+    def toVTK(
+        self, vtkname, line=True, height=0.1, width=0.1, frame="centroid", **kwargs
+    ):
         """Write entire coil set into a VTK file
 
         Args:
@@ -779,10 +1766,18 @@ class Coil(object):
             line (bool, optional): Save coils as polylines or surfaces. Defaults to True.
             height (float, optional): Rectangle height when expanded to a finite cross-section. Defaults to 0.1.
             width (float, optional): Rectangle width when expanded to a finite cross-section. Defaults to 0.1.
+            frame (str, optional): Finite-build frame, see `Coil.frames`. Defaults to "centroid".
             kwargs (dict): Optional kwargs passed to "polyLinesToVTK" or "meshio.Mesh.write".
+
+        A symmetric coil set is unfolded and all the coils are written.
         """
         from pyevtk.hl import polyLinesToVTK, gridToVTK
 
+        if self.nfp > 1 or self.stellsym:
+            return self.unfold().toVTK(
+                vtkname, line=line, height=height, width=width, frame=frame, **kwargs
+            )
+
         if line:
             currents = []
             groups = []
@@ -806,35 +1801,28 @@ class Coil(object):
                 np.concatenate(y),
                 np.concatenate(z),
                 np.array(lx),
-                **kwargs
+                **kwargs,
             )
         else:
             import meshio
 
-            points = []
-            hedrs = []
-            currents = []
-            groups = []
-            nums = []
-            start = 0
-            for i, icoil in enumerate(self):
-                # example of meshio.Mesh can be found at https://github.com/nschloe/meshio
-                xx, yy, zz = icoil.rectangle(width=width, height=height)
-                xx = np.ravel(np.transpose(xx[0:4, :]))
-                yy = np.ravel(np.transpose(yy[0:4, :]))
-                zz = np.ravel(np.transpose(zz[0:4, :]))
-                xyz = np.transpose([xx, yy, zz])
-                points += xyz.tolist()
-                # number of cells is npoints-1
-                ncell = len(xx) // 4 - 1
-                ind = np.reshape(np.arange(4 * ncell + 4) + start, (-1, 4))
-                hedr = [list(ind[j, :]) + list(ind[j + 1, :]) for j in range(ncell)]
-                hedrs += hedr
-                currents += (icoil.I * np.ones(ncell)).tolist()
-                groups += (icoil.group * np.ones(ncell, dtype=int)).tolist()
-                nums += ((i + 1) * np.ones(ncell, dtype=int)).tolist()
-                # update point index number
-                start += len(xx)
+            # four corners of the cross-section at each point
+            _, normal, binormal = self.frames(frame)
+            corners = np.array([[-1, 1], [1, 1], [1, -1], [-1, -1]]) / 2
+            points = (
+                self.xyz[:, np.newaxis, :]
+                + corners[:, 0, np.newaxis] * width * binormal[:, np.newaxis, :]
+                + corners[:, 1, np.newaxis] * height * normal[:, np.newaxis, :]
+            ).reshape(-1, 3)
+            # one hexahedron per segment, connecting the corners of its two ends
+            lengths = np.diff(self.offsets)
+            start = np.ones(len(self.xyz), dtype=bool)
+            start[self.offsets[1:] - 1] = False
+            hedrs = 4 * np.flatnonzero(start)[:, np.newaxis] + np.arange(8)
+            ncell = lengths - 1
+            currents = np.repeat(self.currents, ncell)
+            groups = np.repeat(self.groups, ncell)
+            nums = np.repeat(np.arange(1, len(self.data) + 1), ncell)
             kwargs.setdefault("cell_data", {})
             # coil currents
             kwargs["cell_data"].setdefault("I", [currents])
@@ -846,24 +1834,1062 @@ class Coil(object):
             data.write(vtkname)
         return
 
-    def bfield(self, pos, method="hanson_hirshman"):
+    def _pack(self):
+        """Packed arrays for the fortran kernels.
+
+        Returns:
+            numpy.ndarray: (npoints,3) xyz points of all the coils, one after another.
+            numpy.ndarray: (ncoils+1,) starting index of each coil, the last one is npoints.
+            numpy.ndarray: (ncoils,) coil currents.
+        """
+        return self.xyz, self.offsets.astype(np.int32), self.currents
+
+    def frames(self, frame="centroid", **kwargs):
+        """Orthonormal frames along all the coils (see `SingleCoil.frame`).
+
+        The parallel transport frames of all the coils are computed in one call of the
+        fortran kernel `parallel_frame`.
+
+        Args:
+            frame (str, optional): Finite-build frame, could be one of
+                                  ("centroid", "frenet", "parallel"). Defaults to "centroid".
+            kwargs (dict): Optional kwargs passed to `SingleCoil.frame`.
+
+        Returns:
+            numpy.ndarray: (npoints,3) unit tangents, packed like `self.xyz`.
+            numpy.ndarray: (npoints,3) unit normals, the direction of the coil height.
+            numpy.ndarray: (npoints,3) unit bi-normals, the direction of the coil width.
+        """
+        if frame != "parallel":
+            return tuple(
+                np.concatenate(vectors)
+                for vectors in zip(
+                    *[icoil.frame(frame, **kwargs) for icoil in self.data]
+                )
+            )
+        tangents = [icoil._unit_tangent() for icoil in self.data]
+        v0 = [
+            icoil._parallel_start(tangent, **kwargs)
+            for icoil, tangent in zip(self.data, tangents)
+        ]
+        tangent = np.concatenate(tangents)
+        return _orthonormal_frame(
+            tangent, _parallel_transport(tangent, v0, self.offsets)
+        )
+
+    def filaments(self, nw=2, nh=2, width=0.1, height=0.1, frame="centroid"):
+        """Expand each coil into a bundle of nw*nh filaments (see `SingleCoil.filaments`).
+
+        Args:
+            nw (int, optional): Number of filaments along the width. Defaults to 2.
+            nh (int, optional): Number of filaments along the height. Defaults to 2.
+            width (float, optional): Coil width. Defaults to 0.1.
+            height (float, optional): Coil height. Defaults to 0.1.
+            frame (str, optional): Finite-build frame, see `SingleCoil.frame`. Defaults to "centroid".
+
+        Returns:
+            Coil: The filaments, each coil followed by the next one, carrying I/(nw*nh) each.
+        """
+        nfil = nw * nh
+        xyz = np.concatenate(
+            [
+                np.reshape(icoil.filaments(nw, nh, width, height, frame), (-1, 3))
+                for icoil in self.data
+            ]
+        )
+        lengths = np.repeat(np.diff(self.offsets), nfil)
+        return Coil.from_packed(
+            np.asfortranarray(xyz),
+            np.concatenate(([0], np.cumsum(lengths))),
+            np.repeat(self.currents / nfil, nfil),
+            np.repeat(self.groups, nfil),
+            np.repeat(self.names, nfil),
+            nfp=self.nfp,
+            stellsym=self.stellsym,
+        )
+
+    def bfield(
+        self,
+        pos,
+        method="hanson_hirshman",
+        tol=0.2,
+        model="filament",
+        nw=2,
+        nh=2,
+        width=0.1,
+        height=0.1,
+        frame="centroid",
+    ):
         """Compute the magnetic field from a coil set
 
         Args:
             pos (array_like): Evaluation points, shape is (npoints,3) or (3,).
             method (str, optional): Biot-Savrt computing function. one of the follows:
-                                  "hanson_hirshman": Hanson-Hirshman expression.
+                                  "hanson_hirshman": Hanson-Hirshman expression, all the coils are
+                                                     evaluated in one call of the packed fortran kernel.
                                   "biot_savart": Native Biot-Savart with tagent pre-calculated.
                                                  The tangent can be computed using `SingleCoil.fourier_tanget`
                                                  or `SingleCoil.spline_tanget` (with different orders).
+                                  "tree": Barnes-Hut treecode (`coilpy.treecode.BiotSavartTree`) with
+                                          exact Hanson-Hirshman summation for near segments.
+                                  Other `SingleCoil` methods are looped over coils.
                                   Defaults to "hanson_hirshman".
+            tol (float, optional): Opening angle of the treecode, smaller is more accurate,
+                                   see `BiotSavartTree.bfield`. Defaults to 0.2.
+            model (str, optional): Coil model, "filament" for the coil centerlines or "multifilament"
+                                   for finite-build coils, each expanded into nw*nh filaments
+                                   (`Coil.filaments`). Defaults to "filament".
+            nw, nh, width, height, frame: Finite build of the "multifilament" model, see `Coil.filaments`.
 
         Returns:
             array_like: The computed magnetic field, shape (npoints,3).
+
+        For a symmetric coil set, the stored coils are evaluated at the rotated and
+        reflected evaluation points in one call.
         """
+        if model == "multifilament":
+            coil = self.filaments(nw, nh, width, height, frame)
+            return coil.bfield(pos, method=method, tol=tol)
+        elif model != "filament":
+            raise ValueError("Invalid model option {filament, multifilament}")
         pos = np.atleast_2d(pos)
+        return self._symmetric_sum(pos, lambda p: self._bfield(p, method, tol))
+
+    def _bfield(self, pos, method, tol):
+        if self.num == 0:
+            return np.zeros(np.shape(pos))
+        if method == "hanson_hirshman":
+            from coilpy_fortran import hanson_hirshman_coils
+
+            xyz, offsets, currents = self._pack()
+            return hanson_hirshman_coils(pos, xyz, offsets, currents)
+        elif method == "tree":
+            from .treecode import BiotSavartTree
+
+            return BiotSavartTree.from_coils(*self._pack()).bfield(pos, tol=tol)
         mag = np.zeros_like(pos)
         for icoil in list(self):
             func = getattr(icoil, method)
             mag += func(pos)
         return mag
+
+    def bfield_and_grad(self, pos):
+        """Compute the magnetic field and its analytic gradient from a coil set.
+
+        Both are computed in a single pass over the segments using the packed
+        fortran kernel `hanson_hirshman_grad`.
+
+        Args:
+            pos (array_like): Evaluation points, shape is (npoints,3) or (3,).
+
+        Returns:
+            numpy.ndarray: The magnetic field, shape (npoints,3).
+            numpy.ndarray: The gradient, shape (npoints,3,3), grad[i,j,k] = dB_k/dx_j.
+        """
+        from coilpy_fortran import hanson_hirshman_grad
+
+        pos = np.atleast_2d(pos)
+        xyz, offsets, currents = self._pack()
+        return self._symmetric_sum(
+            pos, lambda p: hanson_hirshman_grad(p, xyz, offsets, currents)
+        )
+
+    def response_matrix(self, pos, group=False, filename=None):
+        """Compute and cache the magnetic field of each coil (or coil group) at fixed points.
+
+        With `group=False`, every coil carries a unit current. With `group=True`, the coils in
+        the same group are combined with their own currents (as in MAKEGRID), so that the rows
+        are scaled by `extcur`-style factors ordered as `numpy.unique(groups)`.
+        The result is cached and used by `self.bfield_from_currents`, together with a copy
+        of the coil geometry, so that it is recomputed once the coils are modified.
+
+        Args:
+            pos (array_like): Evaluation points, shape is (npoints,3) or (3,).
+            group (bool, optional): Combine the coils by their groups. Defaults to False.
+            filename (str, optional): If given, the matrix is stored in a memory-mapped .npy file,
+                                      which can be reopened by `numpy.load(filename, mmap_mode="r")`.
+                                      Defaults to None.
+
+        Returns:
+            numpy.ndarray: The field response, shape (ncoils or ngroups, npoints, 3).
+        """
+        from coilpy_fortran import hanson_hirshman_coils
+
+        pos = np.atleast_2d(pos)
+        xyz, offsets, currents = self._pack()
+        groups = self.groups
+        if group:
+            labels = np.unique(groups)
+            members = [np.flatnonzero(groups == g) for g in labels]
+            weights = currents
+        else:
+            labels = None
+            members = [[i] for i in range(self.num)]
+            weights = np.ones(self.num)
+        shape = (len(members),) + pos.shape
+        if filename is None:
+            matrix = np.zeros(shape)
+        else:
+            matrix = np.lib.format.open_memmap(
+                filename, mode="w+", dtype=float, shape=shape
+            )
+        lengths = np.diff(offsets)
+        for k, index in enumerate(members):
+            sub_xyz = np.concatenate([xyz[offsets[i] : offsets[i + 1]] for i in index])
+            sub_offsets = np.concatenate(([0], np.cumsum(lengths[index])))
+            matrix[k] = self._symmetric_sum(
+                pos,
+                lambda p: hanson_hirshman_coils(
+                    p, sub_xyz, sub_offsets.astype(np.int32), weights[index]
+                ),
+            )
+        if filename is not None:
+            matrix.flush()
+        self._response = {
+            "pos": pos,
+            "group": group,
+            "labels": labels,
+            "matrix": matrix,
+            "geometry": self._geometry(group),
+        }
+        return matrix
+
+    def _geometry(self, group=False):
+        """Copy of everything the response matrix depends on, besides the evaluation points."""
+        geometry = [self.xyz.copy(), self.offsets.copy(), self.nfp, self.stellsym]
+        if group:
+            # the currents within a group are combined into the response
+            geometry += [self.groups.copy(), self.currents]
+        return geometry
+
+    def bfield_from_currents(self, currents, pos=None):
+        """Compute the magnetic field from the cached response matrix for new currents.
+
+        Args:
+            currents (array_like): Coil currents (ncoils,), or group factors (ngroups,) if the
+                                   response matrix is computed with `group=True`.
+            pos (array_like, optional): Evaluation points. If they differ from the cached ones,
+                                        the response matrix is recomputed. Defaults to None.
+
+        Returns:
+            numpy.ndarray: The magnetic field, shape (npoints,3).
+
+        The response matrix is also recomputed if the coils have been modified since it was
+        computed, e.g. by `transform`, `scale`, `interpolate` or direct changes to x, y, z.
+        """
+        cache = getattr(self, "_response", None)
+        if pos is None:
+            if cache is None:
+                raise ValueError("Please compute the response matrix first.")
+            pos = cache["pos"]
+        pos = np.atleast_2d(pos)
+        if (
+            cache is None
+            or not np.array_equal(pos, cache["pos"])
+            or not all(
+                np.array_equal(a, b)
+                for a, b in zip(self._geometry(cache["group"]), cache["geometry"])
+            )
+        ):
+            group = False if cache is None else cache["group"]
+            self.response_matrix(pos, group=group)
+        matrix = self._response["matrix"]
+        currents = np.asarray(currents, dtype=float)
+        assert len(currents) == len(matrix), "dimension not consistent"
+        return np.tensordot(currents, matrix, axes=(0, 0))
+
+    def inductance_matrix(self, radius=None, width=None, height=None):
+        """Compute the mutual and self inductances of closed coils with the Neumann formula.
+
+        The self inductance is regularized for a finite cross-section, either circular
+        (`radius`) or rectangular (`width` and `height`). Coil tangents are
+        computed with FFT. For a symmetric coil set, only the pairs between the
+        stored coils and all the images are computed.
+
+        Args:
+            radius (float or array_like, optional): Radius of the coil cross-section. Defaults to None.
+            width (float or array_like, optional): Width of the rectangular cross-section. Defaults to None.
+            height (float or array_like, optional): Height of the rectangular cross-section. Defaults to None.
+
+        Returns:
+            numpy.ndarray: (ncoils,ncoils) inductance matrix in Henry. For a symmetric coil set,
+                           the coils are ordered as in `Coil.unfold`.
+        """
+        from coilpy_fortran import inductance
+
+        delta = np.broadcast_to(_self_delta(radius, width, height), (self.num,))
+        ops = self._symmetry_ops()
+        nops = len(ops)
+        xyz, dl = [], []
+        for icoil in self.data:
+            rp = icoil._spectral_derivatives()[0]
+            dxyz = rp[:-1] * (2 * np.pi / (len(icoil.x) - 1))
+            for T, _ in ops:
+                xyz.append(icoil.xyz[:-1] @ T.T)
+                dl.append(dxyz @ T.T)
+        lengths = [len(x) for x in xyz]
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int32)
+        # the image m of coil b against the stored coil a, M(a, b, m) = M(b, a, 0) for m = 0
+        a, b, m = np.meshgrid(
+            np.arange(self.num), np.arange(self.num), np.arange(nops), indexing="ij"
+        )
+        compute = (m > 0) | (a <= b)
+        pairs = np.transpose([a[compute] * nops, b[compute] * nops + m[compute]])
+        values = np.zeros((self.num, self.num, nops))
+        values[compute] = inductance(
+            np.concatenate(xyz),
+            np.concatenate(dl),
+            offsets,
+            np.repeat(delta, nops),
+            pairs.astype(np.int32),
+        )
+        lower = np.tril_indices(self.num, -1)
+        values[lower + (0,)] = values[:, :, 0].T[lower]
+        # M((a,k), (b,l)) = M(a, b, m) with T_m = T_k^-1 T_l
+        mult = np.zeros((nops, nops), dtype=int)
+        for k, (Tk, _) in enumerate(ops):
+            for l, (Tl, _) in enumerate(ops):
+                mult[k, l] = [np.allclose(Tk.T @ Tl, T) for T, _ in ops].index(True)
+        matrix = np.transpose(values[:, :, mult], (0, 2, 1, 3))
+        return np.reshape(matrix, (self.num * nops, self.num * nops))
+
+    def forces(self, radius=None, width=None, height=None):
+        """Compute the Lorentz forces and torques on closed coils.
+
+        The field on each coil point is the field of all the other coils plus the self-field
+        regularized for a finite cross-section, either circular (`radius`) or rectangular
+        (`width` and `height`). For a symmetric coil set, the forces are computed on the
+        stored coils under the field of the full coil set.
+
+        Args:
+            radius (float or array_like, optional): Radius of the coil cross-section. Defaults to None.
+            width (float or array_like, optional): Width of the rectangular cross-section. Defaults to None.
+            height (float or array_like, optional): Height of the rectangular cross-section. Defaults to None.
+
+        Returns:
+            numpy.ndarray: (npoints,3) force per unit length (N/m) at the points in `self.xyz`.
+            numpy.ndarray: (ncoils,3) net force on each coil (N).
+            numpy.ndarray: (ncoils,3) net torque on each coil about its centroid (N*m).
+        """
+        from coilpy_fortran import coil_forces
+
+        delta = np.broadcast_to(_self_delta(radius, width, height), (self.num,))
+        coil = self.unfold() if len(self._symmetry_ops()) > 1 else self
+        nops = coil.num // self.num
+        tangent, accel = [], []
+        for icoil in coil.data:
+            rp, rpp = icoil._spectral_derivatives()
+            tangent.append(rp)
+            accel.append(rpp)
+        xyz, offsets, currents = coil._pack()
+        targets = np.arange(self.num) * nops
+        bfield = coil_forces(
+            xyz,
+            np.concatenate(tangent),
+            np.concatenate(accel),
+            offsets,
+            currents,
+            np.repeat(delta, nops),
+            targets.astype(np.int32),
+        )
+        density = np.zeros((len(self.xyz), 3))
+        force = np.zeros((self.num, 3))
+        torque = np.zeros((self.num, 3))
+        for i, k in enumerate(targets):
+            rp = tangent[k]
+            npts = len(rp) - 1
+            fdt = coil.data[k].I * np.cross(rp, bfield[offsets[k] : offsets[k + 1]])
+            density[self.offsets[i] : self.offsets[i + 1]] = (
+                fdt / np.linalg.norm(rp, axis=1)[:, np.newaxis]
+            )
+            points = coil.data[k].xyz
+            force[i] = np.sum(fdt[:-1], axis=0) * 2 * np.pi / npts
+            arm = points[:-1] - np.mean(points[:-1], axis=0)
+            torque[i] = np.sum(np.cross(arm, fdt[:-1]), axis=0) * 2 * np.pi / npts
+        return density, force, torque
+
+    def geometry_metrics(self, pointwise=False, order=3):
+        """Compute the length, curvature, torsion and arclength of all the coils.
+
+        Coils with the same number of points are processed together. Derivatives are
+        computed with FFT for closed coils and with splines of `order` for open coils,
+        using the parameter t in [0, 2pi].
+
+        Args:
+            pointwise (bool, optional): Also return the values at each point. Defaults to False.
+            order (int, optional): Order of the splines for open coils. Defaults to 3.
+
+        Returns:
+            pandas.DataFrame: One row per coil with the name, group, current, length,
+                              maximum and mean curvature, maximum and mean absolute torsion,
+                              and the arclength variation std(|dr/dt|)/mean(|dr/dt|)
+                              (0 for a uniform arclength parametrization).
+            dict: If `pointwise`, (npoints,3) arrays "curvature", "torsion" and "arclength"
+                  at the points in `self.xyz`.
+        """
+        import pandas as pd
+        from scipy.interpolate import make_interp_spline
+        from .misc import fft_deriv
+
+        xyz, offsets = self.xyz, self.offsets
+        npts = np.diff(offsets)
+        closed = np.array(
+            [np.allclose(xyz[o0], xyz[o1 - 1]) for o0, o1 in zip(offsets, offsets[1:])]
+        )
+        curvature = np.zeros(len(xyz))
+        torsion = np.zeros(len(xyz))
+        arclength = np.zeros(len(xyz))
+        length = np.zeros(self.num)
+        variation = np.zeros(self.num)
+        for n, periodic in set(zip(npts, closed)):
+            index = np.flatnonzero((npts == n) & (closed == periodic))
+            points = np.stack([xyz[offsets[i] : offsets[i + 1]] for i in index], axis=1)
+            t = np.linspace(0, 2 * np.pi, n)
+            if periodic:
+                r1 = np.real(fft_deriv(points[:-1]))
+                r2 = np.real(fft_deriv(r1))
+                r3 = np.real(fft_deriv(r2))
+                r1, r2, r3 = [np.concatenate((r, r[:1])) for r in (r1, r2, r3)]
+            else:
+                spline = make_interp_spline(t, points, k=order)
+                r1, r2, r3 = [spline(t, nu=nu) for nu in (1, 2, 3)]
+            # (n, ncoils, 3) arrays
+            speed = np.linalg.norm(r1, axis=2)
+            cross = np.cross(r1, r2)
+            cross2 = np.sum(cross * cross, axis=2)
+            kappa = np.sqrt(cross2) / speed**3
+            tau = np.sum(cross * r3, axis=2) / np.where(cross2 > 0, cross2, np.inf)
+            ds = (speed[1:] + speed[:-1]) / 2 * np.diff(t)[:, np.newaxis]
+            sarc = np.concatenate((np.zeros((1, len(index))), np.cumsum(ds, axis=0)))
+            if periodic:
+                # spectrally accurate for closed coils
+                length[index] = np.mean(speed[:-1], axis=0) * 2 * np.pi
+                variation[index] = np.std(speed[:-1], axis=0) / np.mean(
+                    speed[:-1], axis=0
+                )
+            else:
+                length[index] = sarc[-1]
+                variation[index] = np.std(speed, axis=0) / np.mean(speed, axis=0)
+            for j, i in enumerate(index):
+                curvature[offsets[i] : offsets[i + 1]] = kappa[:, j]
+                torsion[offsets[i] : offsets[i + 1]] = tau[:, j]
+                arclength[offsets[i] : offsets[i + 1]] = sarc[:, j]
+        split = offsets[1:-1]
+        kappa = np.split(curvature, split)
+        tau = np.split(np.abs(torsion), split)
+        table = pd.DataFrame(
+            {
+                "name": self.names,
+                "group": self.groups,
+                "current": self.currents,
+                "length": length,
+                "max_curvature": [np.max(k) for k in kappa],
+                "mean_curvature": [np.mean(k) for k in kappa],
+                "max_torsion": [np.max(k) for k in tau],
+                "mean_torsion": [np.mean(k) for k in tau],
+                "arclength_variation": variation,
+            }
+        )
+        if pointwise:
+            return table, {
+                "curvature": curvature,
+                "torsion": torsion,
+                "arclength": arclength,
+            }
+        return table
+
+    def _segments(self):
+        """Start points, end points and coil indices of all the segments."""
+        xyz, offsets = self.xyz, self.offsets
+        start = np.ones(len(xyz), dtype=bool)
+        start[offsets[1:] - 1] = False
+        index = np.flatnonzero(start)
+        coil = np.searchsorted(offsets, index, side="right") - 1
+        return xyz[index], xyz[index + 1], coil
+
+    def min_coil_coil_distance(self):
+        """Compute the minimum distance between different coils using KD-trees.
+
+        Coil pairs are visited in the order of the gaps between their bounding spheres.
+        An upper bound is found from the closest points, then only the segments whose
+        midpoints are close enough are compared exactly. For a symmetric coil set, the
+        distance is computed for the full coil set.
+
+        Returns:
+            float: The minimum distance between the segments of different coils.
+            tuple: The indices of the closest coils, ordered as in `Coil.unfold` if symmetric.
+            numpy.ndarray: (2,3) the closest points on the two coils.
+        """
+        from scipy.spatial import cKDTree
+
+        coil = self.unfold() if len(self._symmetry_ops()) > 1 else self
+        assert coil.num > 1, "At least two coils are needed."
+        p, q, index = coil._segments()
+        segments = np.split(np.arange(len(p)), np.cumsum(np.bincount(index))[:-1])
+        points = np.split(coil.xyz, coil.offsets[1:-1])
+        trees = [cKDTree(xyz) for xyz in points]
+        center = np.array([np.mean(xyz, axis=0) for xyz in points])
+        radius = np.array(
+            [np.max(np.linalg.norm(xyz - c, axis=1)) for xyz, c in zip(points, center)]
+        )
+        # lower bounds of the coil-coil distances from the bounding spheres
+        first, second = np.triu_indices(coil.num, 1)
+        gap = (
+            np.linalg.norm(center[first] - center[second], axis=1)
+            - radius[first]
+            - radius[second]
+        )
+        order = np.argsort(gap)
+        upper = np.inf
+        for k in order:
+            if gap[k] >= upper:
+                break
+            dist = trees[second[k]].query(points[first[k]], distance_upper_bound=upper)
+            upper = min(upper, np.min(dist[0]))
+        # exact distances of the candidate segments
+        mid = (p + q) / 2
+        half = np.max(np.linalg.norm(q - p, axis=1)) / 2
+        best = (np.inf, None, None)
+        for k in order[gap[order] <= upper]:
+            i, j = segments[first[k]], segments[second[k]]
+            pairs = cKDTree(mid[i]).sparse_distance_matrix(
+                cKDTree(mid[j]), upper + 2 * half, output_type="ndarray"
+            )
+            if len(pairs) == 0:
+                continue
+            i, j = i[pairs["i"]], j[pairs["j"]]
+            dist, c1, c2 = _segment_distance(p[i], q[i], p[j], q[j])
+            m = np.argmin(dist)
+            if dist[m] < best[0]:
+                best = (dist[m], (first[k], second[k]), np.array([c1[m], c2[m]]))
+        return best
+
+    def min_distance_to(self, target, ntheta=128, nzeta=256):
+        """Compute the minimum distance of each coil to a surface or a set of points using a KD-tree.
+
+        Args:
+            target (FourSurf or array_like): The surface, sampled on a (ntheta,nzeta) grid
+                                             over the full torus, or (n,3) points.
+            ntheta (int, optional): Poloidal resolution of the surface. Defaults to 128.
+            nzeta (int, optional): Toroidal resolution of the surface. Defaults to 256.
+
+        Returns:
+            numpy.ndarray: (ncoils,) minimum distance of each coil.
+            numpy.ndarray: (ncoils,) index of the closest point, into the points or
+                           the flattened (ntheta,nzeta) surface grid.
+        """
+        from scipy.spatial import cKDTree
+
+        if hasattr(target, "xyz"):
+            theta = np.linspace(0, 2 * np.pi, ntheta, endpoint=False)
+            zeta = np.linspace(0, 2 * np.pi, nzeta, endpoint=False)
+            tv, zv = np.meshgrid(theta, zeta, indexing="ij")
+            target = np.transpose(target.xyz(tv, zv))
+        target = np.atleast_2d(target)
+        tree = cKDTree(target)
+        # upper bound from the coil points
+        upper = np.minimum.reduceat(tree.query(self.xyz)[0], self.offsets[:-1])
+        # exact distances of the segments to the candidate points
+        p, q, index = self._segments()
+        half = np.linalg.norm(q - p, axis=1) / 2
+        candidates = tree.query_ball_point((p + q) / 2, upper[index] + half)
+        count = [len(c) for c in candidates]
+        seg = np.repeat(np.arange(len(p)), count)
+        point = np.concatenate(candidates).astype(int)
+        dseg = _segment_distance(p[seg], q[seg], target[point], target[point])[0]
+        # the closest point of each coil is always among the candidates of its segments
+        order = np.lexsort((dseg, index[seg]))
+        coils, first = np.unique(index[seg][order], return_index=True)
+        assert len(coils) == self.num, "Each coil should have at least one segment."
+        distance = dseg[order[first]]
+        closest = point[order[first]]
+        return distance, closest
+
+    def _field_periods(self, surface, nfp_reduce=False, nfp=None):
+        """Number of field periods used to reduce a surface evaluation, 1 for the full torus.
+
+        Args:
+            surface (FourSurf): The surface.
+            nfp_reduce (bool, optional): Reduce the evaluation to one field period. Defaults to False.
+            nfp (int, optional): Number of field periods. Defaults to `self.nfp` for a symmetric
+                                 coil set, otherwise `self.periods`.
+
+        Returns:
+            int: The number of field periods.
+        """
+        if not nfp_reduce:
+            return 1
+        periods = self.nfp if self.nfp > 1 else self.periods
+        if nfp is None:
+            nfp = periods
+        nfp = int(nfp)
+        if nfp < 1 or periods % nfp != 0:
+            raise ValueError(
+                "The coil set with {:d} periods does not have {:d} field periods.".format(
+                    periods, nfp
+                )
+            )
+        if np.any(np.rint(surface.xn).astype(int) % nfp != 0):
+            raise ValueError(
+                "The surface does not have {:d} field periods.".format(nfp)
+            )
+        return nfp
+
+    def bnormal(self, surface, ntheta=64, nzeta=64, nfp_reduce=False, nfp=None):
+        """Normal magnetic field on a surface and its Fourier harmonics.
+
+        Args:
+            surface (FourSurf): The surface, usually the plasma boundary.
+            ntheta (int, optional): Poloidal resolution. Defaults to 64.
+            nzeta (int, optional): Toroidal resolution. Defaults to 64.
+            nfp_reduce (bool, optional): Only evaluate one field period. A ValueError is raised
+                                         if the coil set or the surface does not have nfp periods.
+                                         Defaults to False, the full torus.
+            nfp (int, optional): Number of field periods with `nfp_reduce`. Defaults to `self.nfp`
+                                 for a symmetric coil set, otherwise `self.periods`.
+
+        Returns:
+            numpy.ndarray: (ntheta,nzeta) B.n on the half grid of `FourSurf.grid`,
+                           laid out as `FOCUSHDF5.Bn`.
+            dict: Fourier harmonics of B.n, containing 'xm', 'xn', 'bnc', 'bns' as in
+                  `coilpy.misc.read_focus_boundary`, xn in units of nfp.
+        """
+        nfp = self._field_periods(surface, nfp_reduce, nfp)
+        xyz, normal, _ = surface.grid(ntheta, nzeta, nfp)
+        mag = self.bfield(np.reshape(xyz, (-1, 3)))
+        bn = np.einsum("ij,ij->i", mag, np.reshape(normal, (-1, 3)))
+        bn = np.reshape(bn, (ntheta, nzeta))
+        return bn, _grid_spectrum(bn)
+
+    def quadratic_flux(
+        self, surface, ntheta=64, nzeta=64, nfp_reduce=False, nfp=None, gradient=True
+    ):
+        """Quadratic flux, the surface integral of (B.n)^2/|B|^2, and its gradient.
+
+        The gradient is computed in one pass over the coil segments with the adjoint of
+        the packed Hanson-Hirshman kernel (`hanson_hirshman_adjoint`).
+
+        Args:
+            surface (FourSurf): The surface, usually the plasma boundary.
+            ntheta (int, optional): Poloidal resolution. Defaults to 64.
+            nzeta (int, optional): Toroidal resolution. Defaults to 64.
+            nfp_reduce (bool, optional): Integrate over one field period and multiply by nfp,
+                                         see `Coil.bnormal`. Only valid for a symmetric coil
+                                         set (nfp > 1), since the field of a non-symmetric set
+                                         is not known to be periodic. Defaults to False, the
+                                         full torus.
+            nfp (int, optional): Number of field periods with `nfp_reduce`, see `Coil.bnormal`.
+            gradient (bool, optional): Also return the gradients. Defaults to True.
+
+        Returns:
+            float: The quadratic flux.
+            numpy.ndarray: (npoints,3) gradient with respect to the coil points, packed like
+                           `self.xyz`. The repeated last point of a closed coil is a separate point.
+            numpy.ndarray: (ncoils,) gradient with respect to the coil currents.
+
+        For a symmetric coil set, the gradients are with respect to the stored coils, with
+        all the symmetric images moving together.
+        """
+        if nfp_reduce and self.nfp == 1:
+            raise ValueError(
+                "nfp_reduce requires a symmetric coil set, please integrate over the full torus."
+            )
+        nfp = self._field_periods(surface, nfp_reduce, nfp)
+        xyz, normal, jacobian = surface.grid(ntheta, nzeta, nfp)
+        pos = np.reshape(xyz, (-1, 3))
+        normal = np.reshape(normal, (-1, 3))
+        dA = np.ravel(jacobian) * (2 * np.pi / ntheta) * (2 * np.pi / nzeta)
+        mag = self.bfield(pos)
+        bn = np.einsum("ij,ij->i", mag, normal)
+        bb = np.einsum("ij,ij->i", mag, mag)
+        flux = np.sum(dA * bn**2 / bb)
+        if not gradient:
+            return flux
+        from coilpy_fortran import hanson_hirshman_adjoint
+
+        # d(flux)/dB at the surface points
+        factor = (2 * dA * bn / bb)[:, np.newaxis]
+        weight = factor * (normal - (bn / bb)[:, np.newaxis] * mag)
+        ops = self._symmetry_ops()
+        grad, dcurrent = hanson_hirshman_adjoint(
+            np.concatenate([pos @ T for T, _ in ops]),
+            np.concatenate([sign * weight @ T for T, sign in ops]),
+            *self._pack(),
+        )
+        return flux, grad, dcurrent
+
+    def vector_potential(self, pos):
+        """Compute the vector potential from a coil set using the packed fortran kernel.
+
+        Args:
+            pos (array_like): Evaluation points, shape is (npoints,3) or (3,).
+
+        Returns:
+            array_like: The computed vector potential, shape (npoints,3).
+        """
+        from coilpy_fortran import vector_potential_coils
+
+        pos = np.atleast_2d(pos)
+        xyz, offsets, currents = self._pack()
+        return self._symmetric_sum(
+            pos, lambda p: vector_potential_coils(p, xyz, offsets, currents)
+        )
+
+
+class FourierCoil(object):
+    """Python object for a set of coils represented by truncated Fourier series.
+
+    Following FOCUS, each coil is parameterized by t in [0, 2*pi] as
+
+        x(t) = sum_{n=0}^{nf} xc_n cos(nt) + xs_n sin(nt),
+
+    and the same for y and z. Points, tangents and curvature are evaluated at any
+    resolution with inverse real FFTs, so only the coefficients are stored.
+
+    Args:
+        xc, xs, yc, ys, zc, zs (array_like): (ncoil,nf+1) Fourier coefficients.
+        II (list, optional): Coil currents. Defaults to None (all ones).
+        names (list, optional): Coil names. Defaults to None ("coil").
+        groups (list, optional): Coil groups. Defaults to None (1, 2, ...).
+        nfp (int, optional): Number of field periods of a symmetric coil set. Defaults to 1.
+        stellsym (bool, optional): Stellarator symmetry of a symmetric coil set. Defaults to False.
+
+    Use `Coil.from_fourier` to discretize the coils into a `Coil` object.
+    """
+
+    def __init__(
+        self,
+        xc,
+        xs,
+        yc,
+        ys,
+        zc,
+        zs,
+        II=None,
+        names=None,
+        groups=None,
+        nfp=1,
+        stellsym=False,
+    ):
+        self.xc, self.xs, self.yc, self.ys, self.zc, self.zs = [
+            np.atleast_2d(np.asarray(a, dtype=float)) for a in (xc, xs, yc, ys, zc, zs)
+        ]
+        num = len(self.xc)
+        for a in (self.xs, self.yc, self.ys, self.zc, self.zs):
+            assert a.shape == self.xc.shape, "dimension not consistent"
+        self.currents = np.ones(num) if II is None else np.asarray(II, dtype=float)
+        self.names = np.array(["coil"] * num if names is None else names)
+        self.groups = np.arange(1, num + 1) if groups is None else np.asarray(groups)
+        self.nfp = nfp
+        self.stellsym = stellsym
+        return
+
+    @property
+    def num(self):
+        """int: Number of coils."""
+        return len(self.xc)
+
+    @property
+    def nf(self):
+        """int: Number of Fourier modes, excluding the constant one."""
+        return self.xc.shape[1] - 1
+
+    @classmethod
+    def from_coil(cls, coil, nf=None):
+        """Fourier coefficients of the closed coils in a `Coil` object.
+
+        Args:
+            coil (Coil): The coil set, each coil closed by repeating the first point.
+            nf (int, optional): Number of Fourier modes. Defaults to None, the most
+                                modes resolved by the coil with the fewest points.
+
+        Returns:
+            FourierCoil: The coils as Fourier series.
+        """
+        xyz, offsets = coil.xyz, coil.offsets
+        lengths = np.diff(offsets) - 1
+        if nf is None:
+            nf = (np.min(lengths) - 1) // 2
+        coef = np.zeros((coil.num, nf + 1, 3), dtype=complex)
+        # coils with the same number of points are transformed together
+        for n in np.unique(lengths):
+            index = np.flatnonzero(lengths == n)
+            points = xyz[offsets[index, np.newaxis] + np.arange(n)]
+            spec = np.fft.rfft(points, axis=1)[:, : nf + 1, :] * (2.0 / n)
+            spec[:, 0, :] /= 2
+            if n % 2 == 0 and nf >= n // 2:
+                spec[:, n // 2, :] /= 2
+            coef[index, : spec.shape[1], :] = spec
+        xc, yc, zc = np.moveaxis(coef.real, 2, 0)
+        xs, ys, zs = np.moveaxis(-coef.imag, 2, 0)
+        return cls(
+            xc,
+            xs,
+            yc,
+            ys,
+            zc,
+            zs,
+            II=coil.currents,
+            names=coil.names,
+            groups=coil.groups,
+            nfp=coil.nfp,
+            stellsym=coil.stellsym,
+        )
+
+    @classmethod
+    def read_focus(cls, filename, nfp=None):
+        """Read Fourier coils (coil_type = 1) from a FOCUS coil file (*.focus).
+
+        Other coil types in the file are skipped. FOCUS flags each coil with `symm`
+        (0: none, 1: periodic, 2: periodic and stellarator-symmetric). If all the coils
+        share the flag, it is kept as `nfp` and `stellsym`, otherwise the symmetric coils
+        are unfolded.
+
+        Args:
+            filename (str): Path of the FOCUS coil file.
+            nfp (int, optional): Number of field periods, as in the FOCUS plasma boundary.
+                                 Required if any coil is symmetric. Defaults to None.
+
+        Returns:
+            FourierCoil: The Fourier coils, empty if there are none.
+        """
+        coef, currents, names, symm = [], [], [], []
+        with open(filename, "r") as coilfile:
+            coilfile.readline()
+            ncoils = int(coilfile.readline().split()[0])
+            for icoil in range(ncoils):
+                coilfile.readline()
+                coilfile.readline()
+                linelist = coilfile.readline().split()
+                coil_type = int(linelist[0])
+                if coil_type == 1:
+                    symm.append(int(linelist[1]))
+                    name = linelist[2]
+                    coilfile.readline()
+                    current = float(coilfile.readline().split()[1])
+                    coilfile.readline()
+                    nf = int(coilfile.readline().split()[0])
+                    coilfile.readline()
+                    rows = [
+                        np.array(coilfile.readline().split()[: nf + 1], dtype=float)
+                        for i in range(6)
+                    ]
+                    coef.append(rows)
+                    currents.append(current)
+                    names.append(name)
+                elif coil_type in (2, 3):
+                    coilfile.readline()
+                    coilfile.readline()
+                else:
+                    raise ValueError("Invalid coiltype = {:d}.".format(coil_type))
+        if not coef:
+            return cls(*np.zeros((6, 0, 1)), II=[], names=[], groups=[])
+        nf = max(len(rows[0]) for rows in coef) - 1
+        coef = np.array(
+            [[np.pad(row, (0, nf + 1 - len(row))) for row in rows] for rows in coef]
+        )
+        symm = np.array(symm)
+        if np.any(symm > 0) and nfp is None:
+            raise ValueError("nfp is required for the symmetric coils in " + filename)
+        if np.all(symm == symm[0]):
+            return cls(
+                *np.moveaxis(coef, 1, 0),
+                II=currents,
+                names=names,
+                nfp=nfp if symm[0] > 0 else 1,
+                stellsym=bool(symm[0] == 2),
+            )
+        # mixed symmetry, unfold the coils one by one
+        parts = [
+            cls(
+                *np.moveaxis(coef[i : i + 1], 1, 0),
+                II=currents[i : i + 1],
+                names=names[i : i + 1],
+                groups=[i + 1],
+                nfp=nfp if symm[i] > 0 else 1,
+                stellsym=bool(symm[i] == 2),
+            ).unfold()
+            for i in range(len(coef))
+        ]
+        return cls(
+            *[
+                np.concatenate([getattr(part, key) for part in parts])
+                for key in ("xc", "xs", "yc", "ys", "zc", "zs", "currents", "names")
+            ],
+            groups=np.concatenate([part.groups for part in parts]),
+        )
+
+    def save_focus(self, filename, nseg=128):
+        """Write the coils to a FOCUS coil file (*.focus) as coil_type 1.
+
+        A symmetric coil set is written with `symm` = 1 (periodic) or 2 (stellarator-symmetric),
+        FOCUS takes the number of field periods from the plasma boundary.
+
+        Args:
+            filename (str): Path of the FOCUS coil file.
+            nseg (int, optional): Number of segments used by FOCUS. Defaults to 128.
+        """
+        symm = 2 if self.stellsym else (1 if self.nfp > 1 else 0)
+        xyz = self.evaluate(nseg)
+        lengths = np.sum(np.linalg.norm(np.diff(xyz, axis=1), axis=-1), axis=1)
+        with open(filename, "w") as wfile:
+            wfile.write(" # Total number of coils \n")
+            wfile.write("{:6d} \n".format(self.num))
+            for icoil in range(self.num):
+                wfile.write(
+                    "#-----------------{}---------------------------\n".format(
+                        icoil + 1
+                    )
+                )
+                wfile.write("#coil_type   symm  coil_name \n")
+                wfile.write(
+                    "   {:1d}  {:1d}  {:} \n".format(1, symm, self.names[icoil])
+                )
+                wfile.write("#  Nseg  current  Ifree  Length  Lfree  target_length \n")
+                wfile.write(
+                    "{:6d} {:23.15E} {:6d} {:23.15E} {:6d} {:23.15E} \n".format(
+                        nseg,
+                        self.currents[icoil],
+                        1,
+                        lengths[icoil],
+                        1,
+                        lengths[icoil],
+                    )
+                )
+                wfile.write("#NFcoil \n")
+                wfile.write("{:6d} \n".format(self.nf))
+                wfile.write("#Fourier harmonics for coils ( xc; xs; yc; ys; zc; zs) \n")
+                for coef in (self.xc, self.xs, self.yc, self.ys, self.zc, self.zs):
+                    wfile.write(
+                        " ".join("{:23.15E}".format(c) for c in coef[icoil]) + " \n"
+                    )
+        return
+
+    def unfold(self):
+        """Expand a symmetric coil set into the full coil set, ordered as `Coil.unfold`.
+
+        Returns:
+            FourierCoil: The full coil set.
+        """
+        ops = Coil(nfp=self.nfp, stellsym=self.stellsym)._symmetry_ops()
+        nops = len(ops)
+        matrix = np.array([T for T, _ in ops])
+        signs = np.array([sign for _, sign in ops])
+        # images of the coefficients, (ncoil*nops,nf+1,3)
+        cos, sin = [
+            np.einsum("mij,cnj->cmni", matrix, np.stack(coef, axis=-1)).reshape(
+                -1, self.nf + 1, 3
+            )
+            for coef in ((self.xc, self.yc, self.zc), (self.xs, self.ys, self.zs))
+        ]
+        xc, yc, zc = np.moveaxis(cos, 2, 0)
+        xs, ys, zs = np.moveaxis(sin, 2, 0)
+        return FourierCoil(
+            xc,
+            xs,
+            yc,
+            ys,
+            zc,
+            zs,
+            II=(self.currents[:, np.newaxis] * signs).ravel(),
+            names=np.repeat(self.names, nops),
+            groups=np.repeat(self.groups, nops),
+        )
+
+    def _coefficients(self, der=0):
+        """One-sided complex coefficients c_n of the der-th derivative, r = 2*Re(sum c_n exp(int))."""
+        cos = np.stack((self.xc, self.yc, self.zc), axis=-1)
+        sin = np.stack((self.xs, self.ys, self.zs), axis=-1)
+        coef = (cos - 1j * sin) / 2
+        coef[:, 0, :] = cos[:, 0, :] / 2
+        if der > 0:
+            coef *= ((1j * np.arange(self.nf + 1)) ** der)[:, np.newaxis]
+        return coef
+
+    def evaluate(self, num=128, der=0):
+        """Evaluate the coils (or their derivatives) at t = 2*pi*j/num, j = 0, 1, ..., num.
+
+        Args:
+            num (int, optional): Number of segments of each coil. Defaults to 128.
+            der (int, optional): Order of the derivative with respect to t. Defaults to 0.
+
+        Returns:
+            numpy.ndarray: (ncoil,num+1,3) values, the last point repeating the first.
+        """
+        values = _fourier_series(self._coefficients(der), num)
+        return np.concatenate((values, values[:, :1, :]), axis=1)
+
+    def xyz(self, num=128):
+        """(ncoil,num+1,3) coil points, see `FourierCoil.evaluate`."""
+        return self.evaluate(num)
+
+    def tangents(self, num=128):
+        """(ncoil,num+1,3) tangents dr/dt, see `FourierCoil.evaluate`."""
+        return self.evaluate(num, der=1)
+
+    def curvature(self, num=128):
+        """Curvature of the coils.
+
+        Args:
+            num (int, optional): Number of segments of each coil. Defaults to 128.
+
+        Returns:
+            numpy.ndarray: (ncoil,num+1) curvature |r' x r''| / |r'|^3.
+        """
+        r1 = self.evaluate(num, der=1)
+        r2 = self.evaluate(num, der=2)
+        return (
+            np.linalg.norm(np.cross(r1, r2), axis=-1) / np.linalg.norm(r1, axis=-1) ** 3
+        )
+
+    def bfield(self, pos, num=128, **kwargs):
+        """Compute the magnetic field with the coils discretized into num segments.
+
+        Args:
+            pos (array_like): Evaluation points, shape is (npoints,3) or (3,).
+            num (int, optional): Number of segments of each coil. Defaults to 128.
+            kwargs (dict): Optional kwargs passed to `Coil.bfield`.
+
+        Returns:
+            numpy.ndarray: The magnetic field, shape (npoints,3).
+        """
+        return Coil.from_fourier(self, num=num).bfield(pos, **kwargs)
+
+    def quadratic_flux(self, surface, num=128, **kwargs):
+        """Quadratic flux (see `Coil.quadratic_flux`) and its gradient with respect to the coefficients.
+
+        Args:
+            surface (FourSurf): The surface, usually the plasma boundary.
+            num (int, optional): Number of segments of each coil. Defaults to 128.
+            kwargs (dict): Optional kwargs passed to `Coil.quadratic_flux`.
+
+        Returns:
+            float: The quadratic flux.
+            dict: Gradients with respect to 'xc', 'xs', 'yc', 'ys', 'zc', 'zs' ((ncoil,nf+1) each)
+                  and 'currents' ((ncoil,)).
+        """
+        coil = Coil.from_fourier(self, num=num)
+        res = coil.quadratic_flux(surface, **kwargs)
+        if not isinstance(res, tuple):
+            return res
+        flux, grad, dcurrent = res
+        grad = np.reshape(grad, (self.num, num + 1, 3))
+        # chain rule, sum_j dflux/dr_j * (cos(n t_j), sin(n t_j)), t_num = 2pi is t_0
+        periodic = grad[:, :-1, :].copy()
+        periodic[:, 0, :] += grad[:, -1, :]
+        spec = np.fft.rfft(periodic, axis=1)
+        modes = np.arange(self.nf + 1) % num
+        flip = modes > num // 2
+        modes[flip] = num - modes[flip]
+        spec = spec[:, modes, :]
+        spec[:, flip, :] = np.conj(spec[:, flip, :])
+        dcos, dsin = np.moveaxis(spec.real, 2, 0), np.moveaxis(-spec.imag, 2, 0)
+        return flux, {
+            "xc": dcos[0],
+            "xs": dsin[0],
+            "yc": dcos[1],
+            "ys": dsin[1],
+            "zc": dcos[2],
+            "zs": dsin[2],
+            "currents": dcurrent,
+        }
@@ -95,8 +95,30 @@ class Regcoil(Netcdf):
         self.k[2, :, :] = (dz - fz.reshape((self.ntheta_coil, self.nzetal_coil))) / norm
         return self.k
 
-    def bfield(self, pos, fortran=True):
+    def bfield(self, pos, fortran=True, method="direct", tol=0.2):
+        """Calculate the magnetic field produced by the surface current `self.k`.
+
+        Args:
+            pos (array_like): Evaluation points in Cartesian coordinates, shape (npoints,3) or (3,).
+            fortran (bool, optional): Use the fortran kernel for direct summation. Defaults to True.
+            method (str, optional): "direct" summation or "tree" for the Barnes-Hut treecode
+                                    (`coilpy.treecode.BiotSavartTree`). Defaults to "direct".
+            tol (float, optional): Opening angle of the treecode, smaller is more accurate. Defaults to 0.2.
+
+        Returns:
+            numpy.ndarray: B vector at the evaluation points, shape (npoints,3).
+        """
         pos = np.atleast_2d(pos)
+        if method == "tree":
+            from .treecode import BiotSavartTree
+
+            dtdz = (self.theta_coil[1] - self.theta_coil[0]) * (
+                self.zeta_coil[1] - self.zeta_coil[0]
+            )
+            tree = BiotSavartTree.from_surface(
+                self.r_coil, self.k.T, self.norm_normal_coill.T, dtdz
+            )
+            return tree.bfield(pos, tol=tol)
         if fortran:
             return self._bfield_fortran(pos)
         else:
@@ -160,6 +182,25 @@ class Regcoil(Netcdf):
             pos, self.r_coil, self.k.T, self.norm_normal_coill.T, dtdz
         )
 
+    def vector_potential(self, pos):
+        """Calculate the vector potential produced by the surface current `self.k`.
+
+        Args:
+            pos (array_like): Evaluation points in Cartesian coordinates, shape (npoints,3) or (3,).
+
+        Returns:
+            numpy.ndarray: A vector at the evaluation points, shape (npoints,3).
+        """
+        from coilpy_fortran import surface_current_potential
+
+        pos = np.atleast_2d(pos)
+        dtdz = (self.theta_coil[1] - self.theta_coil[0]) * (
+            self.zeta_coil[1] - self.zeta_coil[0]
+        )
+        return surface_current_potential(
+            pos, self.r_coil, self.k.T, self.norm_normal_coill.T, dtdz
+        )
+
     def bfield_cyl(self, rpz):
         rpz = np.atleast_2d(rpz)
         cosphi = np.cos(rpz[:, 1])
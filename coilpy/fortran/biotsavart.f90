@@ -21,6 +21,7 @@ SUBROUTINE biot_savart(pos, coilxyz, current, dl, bfield, npos, nseg)
    REAL*8 :: x, y, z, lx, ly, lz, rm3, Bx, By, Bz
    REAL*8, PARAMETER :: mu0_over_4pi = 1.0E-7
 
+   !$OMP PARALLEL DO DEFAULT(SHARED) PRIVATE(j, x, y, z, lx, ly, lz, rm3, Bx, By, Bz)
    DO i = 1, npos
       x = pos(i, 1); y = pos(i, 2); z = pos(i, 3)
       Bx = 0; By = 0; Bz = 0
@@ -37,6 +38,7 @@ SUBROUTINE biot_savart(pos, coilxyz, current, dl, bfield, npos, nseg)
       bfield(i, 2) = By
       bfield(i, 3) = Bz
    END DO
+   !$OMP END PARALLEL DO
 
    bfield = bfield*mu0_over_4pi*current
 
@@ -65,6 +67,8 @@ SUBROUTINE hanson_hirshman(pos, coilxyz, current, bfield, npos, nseg)
    REAL*8 :: x, y, z, Rix, Riy, Riz, Ri, Rfx, Rfy, Rfz, Rf, lx, ly, lz, ll, Rfac, Bx, By, Bz
    REAL*8, PARAMETER :: mu0_over_4pi = 1.0E-7
 
+   !$OMP PARALLEL DO DEFAULT(SHARED) &
+   !$OMP& PRIVATE(j, x, y, z, Rix, Riy, Riz, Ri, Rfx, Rfy, Rfz, Rf, lx, ly, lz, ll, Rfac, Bx, By, Bz)
    DO i = 1, npos
       x = pos(i, 1); y = pos(i, 2); z = pos(i, 3)
       Bx = 0; By = 0; Bz = 0
@@ -84,12 +88,353 @@ SUBROUTINE hanson_hirshman(pos, coilxyz, current, bfield, npos, nseg)
       bfield(i, 2) = By
       bfield(i, 3) = Bz
    END DO
+   !$OMP END PARALLEL DO
 
    bfield = bfield*mu0_over_4pi*current
 
    RETURN
 END SUBROUTINE hanson_hirshman
 
+SUBROUTINE vector_potential(pos, coilxyz, current, apot, npos, nseg)
+   ! Calculate vector potential of a piecewise-linear filament (exact for straight segments)
+   !
+   ! input params:
+   !       pos(npos,3): double, positions to be evaluated
+   !       coilxyz(nseg,3): double, xyz points for the coil
+   !       current: double, coil current
+   !       npos: int, optional, number of evaluation points
+   !       nseg: int, optional, number of coil segments
+   ! output params:
+   !       apot(npos,3): double, A-vec at the evaluation points
+   IMPLICIT NONE
+
+   INTEGER, INTENT(IN) :: npos, nseg
+   REAL*8, INTENT(IN) :: pos(npos, 3), coilxyz(nseg, 3), current
+   REAL*8, INTENT(OUT) :: apot(npos, 3)
+
+   INTEGER :: i, j
+   REAL*8 :: x, y, z, Rix, Riy, Riz, Ri, Rfx, Rfy, Rfz, Rf, lx, ly, lz, ll, Rfac, Ax, Ay, Az
+   REAL*8, PARAMETER :: mu0_over_4pi = 1.0E-7
+
+   !$OMP PARALLEL DO DEFAULT(SHARED) &
+   !$OMP& PRIVATE(j, x, y, z, Rix, Riy, Riz, Ri, Rfx, Rfy, Rfz, Rf, lx, ly, lz, ll, Rfac, Ax, Ay, Az)
+   DO i = 1, npos
+      x = pos(i, 1); y = pos(i, 2); z = pos(i, 3)
+      Ax = 0; Ay = 0; Az = 0
+      DO j = 1, nseg - 1
+         Rix = x - coilxyz(j, 1); Rfx = x - coilxyz(j + 1, 1); lx = coilxyz(j + 1, 1) - coilxyz(j, 1)
+         Riy = y - coilxyz(j, 2); Rfy = y - coilxyz(j + 1, 2); ly = coilxyz(j + 1, 2) - coilxyz(j, 2)
+         Riz = z - coilxyz(j, 3); Rfz = z - coilxyz(j + 1, 3); lz = coilxyz(j + 1, 3) - coilxyz(j, 3)
+         Ri = sqrt(Rix*Rix + Riy*Riy + Riz*Riz)
+         Rf = sqrt(Rfx*Rfx + Rfy*Rfy + Rfz*Rfz)
+         ll = sqrt(lx*lx + ly*ly + lz*lz)
+         IF (ll == 0) CYCLE
+         Rfac = log((Ri + Rf + ll)/(Ri + Rf - ll))/ll
+         Ax = Ax + Rfac*lx
+         Ay = Ay + Rfac*ly
+         Az = Az + Rfac*lz
+      END DO
+      apot(i, 1) = Ax
+      apot(i, 2) = Ay
+      apot(i, 3) = Az
+   END DO
+   !$OMP END PARALLEL DO
+
+   apot = apot*mu0_over_4pi*current
+
+   RETURN
+END SUBROUTINE vector_potential
+
+SUBROUTINE hanson_hirshman_coils(pos, coilxyz, offsets, currents, bfield, npos, npts, ncoil)
+   ! Calculate magnetic field from a set of coils using the Hanson-Hirshman expression
+   ! (all the coils are packed one after another in coilxyz)
+   !
+   ! input params:
+   !       pos(npos,3): double, positions to be evaluated
+   !       coilxyz(npts,3): double, xyz points for all the coils
+   !       offsets(ncoil+1): int, starting index (0-based) of each coil in coilxyz, offsets(ncoil+1) = npts
+   !       currents(ncoil): double, coil currents
+   !       npos: int, optional, number of evaluation points
+   !       npts: int, optional, total number of coil points
+   !       ncoil: int, optional, number of coils
+   ! output params:
+   !       bfield(npos,3): double, B-vec at the evaluation points
+   IMPLICIT NONE
+
+   INTEGER, INTENT(IN) :: npos, npts, ncoil
+   INTEGER, INTENT(IN) :: offsets(ncoil + 1)
+   REAL*8, INTENT(IN) :: pos(npos, 3), coilxyz(npts, 3), currents(ncoil)
+   REAL*8, INTENT(OUT) :: bfield(npos, 3)
+
+   INTEGER :: i, j, k
+   REAL*8 :: x, y, z, Rix, Riy, Riz, Ri, Rfx, Rfy, Rfz, Rf, lx, ly, lz, ll, Rfac, Bx, By, Bz, &
+      & Cx, Cy, Cz
+   REAL*8, PARAMETER :: mu0_over_4pi = 1.0E-7
+
+   !$OMP PARALLEL DO DEFAULT(SHARED) &
+   !$OMP& PRIVATE(j, k, x, y, z, Rix, Riy, Riz, Ri, Rfx, Rfy, Rfz, Rf, lx, ly, lz, ll, Rfac, Bx, By, Bz, Cx, Cy, Cz)
+   DO i = 1, npos
+      x = pos(i, 1); y = pos(i, 2); z = pos(i, 3)
+      Bx = 0; By = 0; Bz = 0
+      DO k = 1, ncoil
+         Cx = 0; Cy = 0; Cz = 0
+         DO j = offsets(k) + 1, offsets(k + 1) - 1
+            Rix = x - coilxyz(j, 1); Rfx = x - coilxyz(j + 1, 1); lx = coilxyz(j + 1, 1) - coilxyz(j, 1)
+            Riy = y - coilxyz(j, 2); Rfy = y - coilxyz(j + 1, 2); ly = coilxyz(j + 1, 2) - coilxyz(j, 2)
+            Riz = z - coilxyz(j, 3); Rfz = z - coilxyz(j + 1, 3); lz = coilxyz(j + 1, 3) - coilxyz(j, 3)
+            Ri = sqrt(Rix*Rix + Riy*Riy + Riz*Riz)
+            Rf = sqrt(Rfx*Rfx + Rfy*Rfy + Rfz*Rfz)
+            ll = sqrt(lx*lx + ly*ly + lz*lz)
+            Rfac = 2*(Ri + Rf)/(Ri*Rf)/((Ri + Rf)**2 - ll**2)
+            Cx = Cx + Rfac*(ly*Riz - lz*Riy)
+            Cy = Cy + Rfac*(lz*Rix - lx*Riz)
+            Cz = Cz + Rfac*(lx*Riy - ly*Rix)
+         END DO
+         Bx = Bx + Cx*currents(k)
+         By = By + Cy*currents(k)
+         Bz = Bz + Cz*currents(k)
+      END DO
+      bfield(i, 1) = Bx
+      bfield(i, 2) = By
+      bfield(i, 3) = Bz
+   END DO
+   !$OMP END PARALLEL DO
+
+   bfield = bfield*mu0_over_4pi
+
+   RETURN
+END SUBROUTINE hanson_hirshman_coils
+
+SUBROUTINE hanson_hirshman_grad(pos, coilxyz, offsets, currents, bfield, grad, npos, npts, ncoil)
+   ! Calculate magnetic field and its gradient from a set of coils using the Hanson-Hirshman expression
+   ! (all the coils are packed one after another in coilxyz)
+   !
+   ! input params:
+   !       pos(npos,3): double, positions to be evaluated
+   !       coilxyz(npts,3): double, xyz points for all the coils
+   !       offsets(ncoil+1): int, starting index (0-based) of each coil in coilxyz, offsets(ncoil+1) = npts
+   !       currents(ncoil): double, coil currents
+   !       npos: int, optional, number of evaluation points
+   !       npts: int, optional, total number of coil points
+   !       ncoil: int, optional, number of coils
+   ! output params:
+   !       bfield(npos,3): double, B-vec at the evaluation points
+   !       grad(npos,3,3): double, grad(i,j,k) = dB_k/dx_j at the evaluation points
+   IMPLICIT NONE
+
+   INTEGER, INTENT(IN) :: npos, npts, ncoil
+   INTEGER, INTENT(IN) :: offsets(ncoil + 1)
+   REAL*8, INTENT(IN) :: pos(npos, 3), coilxyz(npts, 3), currents(ncoil)
+   REAL*8, INTENT(OUT) :: bfield(npos, 3), grad(npos, 3, 3)
+
+   INTEGER :: i, j, k, m
+   REAL*8 :: Ri(3), Rf(3), l(3), C(3), dF(3), B(3), Bc(3), G(3, 3), Gc(3, 3), &
+      & Rim, Rfm, ll, ss, dd, Rfac
+   REAL*8, PARAMETER :: mu0_over_4pi = 1.0E-7
+
+   !$OMP PARALLEL DO DEFAULT(SHARED) &
+   !$OMP& PRIVATE(j, k, m, Ri, Rf, l, C, dF, B, Bc, G, Gc, Rim, Rfm, ll, ss, dd, Rfac)
+   DO i = 1, npos
+      B = 0; G = 0
+      DO k = 1, ncoil
+         Bc = 0; Gc = 0
+         DO j = offsets(k) + 1, offsets(k + 1) - 1
+            Ri = pos(i, :) - coilxyz(j, :)
+            Rf = pos(i, :) - coilxyz(j + 1, :)
+            l = coilxyz(j + 1, :) - coilxyz(j, :)
+            Rim = sqrt(SUM(Ri*Ri))
+            Rfm = sqrt(SUM(Rf*Rf))
+            ll = SUM(l*l)
+            ss = Rim + Rfm
+            dd = ss*ss - ll
+            Rfac = 2*ss/(Rim*Rfm)/dd
+            ! B = Rfac * (l x Ri)
+            C(1) = l(2)*Ri(3) - l(3)*Ri(2)
+            C(2) = l(3)*Ri(1) - l(1)*Ri(3)
+            C(3) = l(1)*Ri(2) - l(2)*Ri(1)
+            ! gradient of Rfac
+            dF = Rfac*((Ri/Rim + Rf/Rfm)*(1/ss - 2*ss/dd) - Ri/Rim**2 - Rf/Rfm**2)
+            Bc = Bc + Rfac*C
+            DO m = 1, 3
+               Gc(m, :) = Gc(m, :) + dF(m)*C
+            END DO
+            ! d(l x Ri)_k/dx_j = (l x e_j)_k
+            Gc(1, 2) = Gc(1, 2) + Rfac*l(3); Gc(1, 3) = Gc(1, 3) - Rfac*l(2)
+            Gc(2, 1) = Gc(2, 1) - Rfac*l(3); Gc(2, 3) = Gc(2, 3) + Rfac*l(1)
+            Gc(3, 1) = Gc(3, 1) + Rfac*l(2); Gc(3, 2) = Gc(3, 2) - Rfac*l(1)
+         END DO
+         B = B + Bc*currents(k)
+         G = G + Gc*currents(k)
+      END DO
+      bfield(i, :) = B*mu0_over_4pi
+      grad(i, :, :) = G*mu0_over_4pi
+   END DO
+   !$OMP END PARALLEL DO
+
+   RETURN
+END SUBROUTINE hanson_hirshman_grad
+
+SUBROUTINE hanson_hirshman_adjoint(pos, weight, coilxyz, offsets, currents, grad, dcurrent, npos, npts, ncoil)
+   ! Calculate the gradient of sum_i weight_i . B(pos_i) with respect to the coil points and currents,
+   ! B from the Hanson-Hirshman expression (same coil packing as hanson_hirshman_coils)
+   !
+   ! For a segment from x_j to x_(j+1), Ri = pos - x_j, Rf = pos - x_(j+1), C = Ri x Rf,
+   !     B = mu0 I / 4pi F C,  F = s / (p q),  s = |Ri| + |Rf|,  p = |Ri| |Rf|,  q = p + Ri . Rf,
+   ! the gradients of w . B are
+   !     d/dRi = mu0 I / 4pi [ F (Rf x w) + (w . C) grad_Ri F ],
+   !     d/dRf = mu0 I / 4pi [-F (Ri x w) + (w . C) grad_Rf F ],
+   !     grad_Ri F = F [ Ri / (|Ri| s) - Ri / |Ri|^2 - (|Rf| Ri / |Ri| + Rf) / q ].
+   !
+   ! input params:
+   !       pos(npos,3): double, evaluation positions
+   !       weight(npos,3): double, adjoint weights, usually d(objective)/dB at the positions
+   !       coilxyz(npts,3): double, xyz points for all the coils
+   !       offsets(ncoil+1): int, starting index (0-based) of each coil in coilxyz, offsets(ncoil+1) = npts
+   !       currents(ncoil): double, coil currents
+   !       npos: int, optional, number of evaluation points
+   !       npts: int, optional, total number of coil points
+   !       ncoil: int, optional, number of coils
+   ! output params:
+   !       grad(npts,3): double, gradient with respect to each coil point
+   !       dcurrent(ncoil): double, gradient with respect to each coil current
+   IMPLICIT NONE
+
+   INTEGER, INTENT(IN) :: npos, npts, ncoil
+   INTEGER, INTENT(IN) :: offsets(ncoil + 1)
+   REAL*8, INTENT(IN) :: pos(npos, 3), weight(npos, 3), coilxyz(npts, 3), currents(ncoil)
+   REAL*8, INTENT(OUT) :: grad(npts, 3), dcurrent(ncoil)
+
+   INTEGER :: i, j, k
+   INTEGER, ALLOCATABLE :: owner(:)
+   REAL*8, ALLOCATABLE :: gi(:, :), gf(:, :), dseg(:)
+   REAL*8 :: Rix, Riy, Riz, Ri, Rfx, Rfy, Rfz, Rf, wx, wy, wz, Cx, Cy, Cz, ss, pp, qq, FF, wC, &
+      & ax, ay, az, bx, by, bz, sx, sy, sz, ex, ey, ez, acc
+   REAL*8, PARAMETER :: mu0_over_4pi = 1.0E-7
+
+   ALLOCATE (owner(npts), gi(npts, 3), gf(npts, 3), dseg(npts))
+   owner = 0
+   DO k = 1, ncoil
+      owner(offsets(k) + 1:offsets(k + 1) - 1) = k
+   END DO
+   gi = 0; gf = 0; dseg = 0
+
+   !$OMP PARALLEL DO DEFAULT(SHARED) SCHEDULE(DYNAMIC) &
+   !$OMP& PRIVATE(i, Rix, Riy, Riz, Ri, Rfx, Rfy, Rfz, Rf, wx, wy, wz, Cx, Cy, Cz, ss, pp, qq, FF, wC, &
+   !$OMP& ax, ay, az, bx, by, bz, sx, sy, sz, ex, ey, ez, acc)
+   DO j = 1, npts
+      IF (owner(j) == 0) CYCLE
+      sx = 0; sy = 0; sz = 0
+      ex = 0; ey = 0; ez = 0
+      acc = 0
+      DO i = 1, npos
+         Rix = pos(i, 1) - coilxyz(j, 1); Rfx = pos(i, 1) - coilxyz(j + 1, 1)
+         Riy = pos(i, 2) - coilxyz(j, 2); Rfy = pos(i, 2) - coilxyz(j + 1, 2)
+         Riz = pos(i, 3) - coilxyz(j, 3); Rfz = pos(i, 3) - coilxyz(j + 1, 3)
+         wx = weight(i, 1); wy = weight(i, 2); wz = weight(i, 3)
+         Ri = sqrt(Rix*Rix + Riy*Riy + Riz*Riz)
+         Rf = sqrt(Rfx*Rfx + Rfy*Rfy + Rfz*Rfz)
+         Cx = Riy*Rfz - Riz*Rfy
+         Cy = Riz*Rfx - Rix*Rfz
+         Cz = Rix*Rfy - Riy*Rfx
+         ss = Ri + Rf
+         pp = Ri*Rf
+         qq = pp + Rix*Rfx + Riy*Rfy + Riz*Rfz
+         FF = ss/(pp*qq)
+         wC = wx*Cx + wy*Cy + wz*Cz
+         acc = acc + FF*wC
+         ! grad_Ri F / F and grad_Rf F / F, along Ri and Rf
+         ax = 1/(Ri*ss) - 1/(Ri*Ri) - Rf/(Ri*qq)
+         ay = -1/qq
+         bx = 1/(Rf*ss) - 1/(Rf*Rf) - Ri/(Rf*qq)
+         by = -1/qq
+         ! d/dRi
+         sx = sx + FF*((Rfy*wz - Rfz*wy) + wC*(ax*Rix + ay*Rfx))
+         sy = sy + FF*((Rfz*wx - Rfx*wz) + wC*(ax*Riy + ay*Rfy))
+         sz = sz + FF*((Rfx*wy - Rfy*wx) + wC*(ax*Riz + ay*Rfz))
+         ! d/dRf
+         ex = ex + FF*(-(Riy*wz - Riz*wy) + wC*(bx*Rfx + by*Rix))
+         ey = ey + FF*(-(Riz*wx - Rix*wz) + wC*(bx*Rfy + by*Riy))
+         ez = ez + FF*(-(Rix*wy - Riy*wx) + wC*(bx*Rfz + by*Riz))
+      END DO
+      ! Ri = pos - x_j and Rf = pos - x_(j+1)
+      az = currents(owner(j))*mu0_over_4pi
+      gi(j, :) = -az*(/sx, sy, sz/)
+      gf(j, :) = -az*(/ex, ey, ez/)
+      dseg(j) = acc*mu0_over_4pi
+   END DO
+   !$OMP END PARALLEL DO
+
+   grad = gi
+   grad(2:npts, :) = grad(2:npts, :) + gf(1:npts - 1, :)
+   dcurrent = 0
+   DO j = 1, npts
+      IF (owner(j) > 0) dcurrent(owner(j)) = dcurrent(owner(j)) + dseg(j)
+   END DO
+   DEALLOCATE (owner, gi, gf, dseg)
+
+   RETURN
+END SUBROUTINE hanson_hirshman_adjoint
+
+SUBROUTINE vector_potential_coils(pos, coilxyz, offsets, currents, apot, npos, npts, ncoil)
+   ! Calculate vector potential from a set of piecewise-linear filaments
+   ! (all the coils are packed one after another in coilxyz)
+   !
+   ! input params:
+   !       pos(npos,3): double, positions to be evaluated
+   !       coilxyz(npts,3): double, xyz points for all the coils
+   !       offsets(ncoil+1): int, starting index (0-based) of each coil in coilxyz, offsets(ncoil+1) = npts
+   !       currents(ncoil): double, coil currents
+   !       npos: int, optional, number of evaluation points
+   !       npts: int, optional, total number of coil points
+   !       ncoil: int, optional, number of coils
+   ! output params:
+   !       apot(npos,3): double, A-vec at the evaluation points
+   IMPLICIT NONE
+
+   INTEGER, INTENT(IN) :: npos, npts, ncoil
+   INTEGER, INTENT(IN) :: offsets(ncoil + 1)
+   REAL*8, INTENT(IN) :: pos(npos, 3), coilxyz(npts, 3), currents(ncoil)
+   REAL*8, INTENT(OUT) :: apot(npos, 3)
+
+   INTEGER :: i, j, k
+   REAL*8 :: x, y, z, Ri, Rf, lx, ly, lz, ll, Rfac, Ax, Ay, Az, Cx, Cy, Cz
+   REAL*8, PARAMETER :: mu0_over_4pi = 1.0E-7
+
+   !$OMP PARALLEL DO DEFAULT(SHARED) &
+   !$OMP& PRIVATE(j, k, x, y, z, Ri, Rf, lx, ly, lz, ll, Rfac, Ax, Ay, Az, Cx, Cy, Cz)
+   DO i = 1, npos
+      x = pos(i, 1); y = pos(i, 2); z = pos(i, 3)
+      Ax = 0; Ay = 0; Az = 0
+      DO k = 1, ncoil
+         Cx = 0; Cy = 0; Cz = 0
+         DO j = offsets(k) + 1, offsets(k + 1) - 1
+            lx = coilxyz(j + 1, 1) - coilxyz(j, 1)
+            ly = coilxyz(j + 1, 2) - coilxyz(j, 2)
+            lz = coilxyz(j + 1, 3) - coilxyz(j, 3)
+            ll = sqrt(lx*lx + ly*ly + lz*lz)
+            IF (ll == 0) CYCLE
+            Ri = sqrt((x - coilxyz(j, 1))**2 + (y - coilxyz(j, 2))**2 + (z - coilxyz(j, 3))**2)
+            Rf = sqrt((x - coilxyz(j + 1, 1))**2 + (y - coilxyz(j + 1, 2))**2 + (z - coilxyz(j + 1, 3))**2)
+            Rfac = log((Ri + Rf + ll)/(Ri + Rf - ll))/ll
+            Cx = Cx + Rfac*lx
+            Cy = Cy + Rfac*ly
+            Cz = Cz + Rfac*lz
+         END DO
+         Ax = Ax + Cx*currents(k)
+         Ay = Ay + Cy*currents(k)
+         Az = Az + Cz*currents(k)
+      END DO
+      apot(i, 1) = Ax
+      apot(i, 2) = Ay
+      apot(i, 3) = Az
+   END DO
+   !$OMP END PARALLEL DO
+
+   apot = apot*mu0_over_4pi
+
+   RETURN
+END SUBROUTINE vector_potential_coils
+
 SUBROUTINE surface_current(pos, surface, current, norm, dtdz, bfield, npos, nzeta, ntheta)
    ! Calculate magnetic field from a surface current using the Biot-Savart Law 
    !
@@ -115,6 +460,7 @@ SUBROUTINE surface_current(pos, surface, current, norm, dtdz, bfield, npos, nzet
    REAL*8 :: x, y, z, lx, ly, lz, rm3, Bx, By, Bz
    REAL*8, PARAMETER :: mu0_over_4pi = 1.0E-7
 
+   !$OMP PARALLEL DO DEFAULT(SHARED) PRIVATE(j, k, x, y, z, lx, ly, lz, rm3, Bx, By, Bz)
    DO i = 1, npos
       x = pos(i, 1); y = pos(i, 2); z = pos(i, 3)
       Bx = 0; By = 0; Bz = 0
@@ -133,6 +479,7 @@ SUBROUTINE surface_current(pos, surface, current, norm, dtdz, bfield, npos, nzet
       bfield(i, 2) = By
       bfield(i, 3) = Bz
    END DO
+   !$OMP END PARALLEL DO
 
    bfield = bfield*mu0_over_4pi*dtdz
 
@@ -140,6 +487,335 @@ SUBROUTINE surface_current(pos, surface, current, norm, dtdz, bfield, npos, nzet
 
 END SUBROUTINE surface_current
 
+SUBROUTINE surface_current_potential(pos, surface, current, norm, dtdz, apot, npos, nzeta, ntheta)
+   ! Calculate vector potential from a surface current
+   !
+   ! input params:
+   !       pos(npos,3): double, positions to be evaluated
+   !       surface(nzeta,ntheta,3): double, xyz points for the current-carrying surface
+   !       current(nzeta,ntheta,3): double, surface current in cartesian coordinates
+   !       norm(nzeta,ntheta): double, surface normal / jacobian
+   !       dtdz: double, dtheta * dzeta used for the surface integral
+   !       npos: int, optional, number of evaluation points
+   !       nzeta: int, optional, number of toroidal resolution of the surface current
+   !       ntheta: int, optional, number of poloidal resolution of the surface current
+   ! output params:
+   !       apot(npos,3): double, A-vec at the evaluation points
+   IMPLICIT NONE
+
+   INTEGER, INTENT(IN) :: npos, nzeta, ntheta
+   REAL*8, INTENT(IN) :: dtdz, pos(npos,3), surface(nzeta,ntheta,3), &
+      & current(nzeta,ntheta,3), norm(nzeta,ntheta)
+   REAL*8, INTENT(OUT) :: apot(npos,3)
+
+   INTEGER :: i, j, k
+   REAL*8 :: x, y, z, rm1, Ax, Ay, Az
+   REAL*8, PARAMETER :: mu0_over_4pi = 1.0E-7
+
+   !$OMP PARALLEL DO DEFAULT(SHARED) PRIVATE(j, k, x, y, z, rm1, Ax, Ay, Az)
+   DO i = 1, npos
+      x = pos(i, 1); y = pos(i, 2); z = pos(i, 3)
+      Ax = 0; Ay = 0; Az = 0
+      DO j = 1, nzeta
+         DO k = 1, ntheta
+            rm1 = norm(j, k)/sqrt((x - surface(j, k, 1))**2 + (y - surface(j, k, 2))**2 &
+               & + (z - surface(j, k, 3))**2)
+            Ax = Ax + current(j, k, 1)*rm1
+            Ay = Ay + current(j, k, 2)*rm1
+            Az = Az + current(j, k, 3)*rm1
+         END DO
+      END DO
+      apot(i, 1) = Ax
+      apot(i, 2) = Ay
+      apot(i, 3) = Az
+   END DO
+   !$OMP END PARALLEL DO
+
+   apot = apot*mu0_over_4pi*dtdz
+
+   RETURN
+
+END SUBROUTINE surface_current_potential
+
+SUBROUTINE inductance(coilxyz, dl, offsets, delta, pairs, minduct, npts, ncoil, npair)
+   ! Calculate mutual and self inductances of closed coils with the Neumann formula
+   ! (all the coils are packed one after another in coilxyz, without repeating the first point)
+   !
+   ! The self inductance uses the regularized kernel 1/sqrt(|r-r'|^2 + delta) of
+   ! Hurwitz, Landreman & Antonsen, with the singular part integrated analytically.
+   !
+   ! input params:
+   !       coilxyz(npts,3): double, xyz points for all the coils
+   !       dl(npts,3): double, tangent * dt at each point, dt = 2*pi / number of points in the coil
+   !       offsets(ncoil+1): int, starting index (0-based) of each coil in coilxyz, offsets(ncoil+1) = npts
+   !       delta(ncoil): double, regularization of the self inductance (a^2/sqrt(e) for circular sections)
+   !       pairs(npair,2): int, coil indices (0-based) of the inductances to be calculated
+   !       npts: int, optional, total number of coil points
+   !       ncoil: int, optional, number of coils
+   !       npair: int, optional, number of coil pairs
+   ! output params:
+   !       minduct(npair): double, inductance of each pair
+   IMPLICIT NONE
+
+   INTEGER, INTENT(IN) :: npts, ncoil, npair
+   INTEGER, INTENT(IN) :: offsets(ncoil + 1), pairs(npair, 2)
+   REAL*8, INTENT(IN) :: coilxyz(npts, 3), dl(npts, 3), delta(ncoil)
+   REAL*8, INTENT(OUT) :: minduct(npair)
+
+   INTEGER :: ip, k1, k2, i, j, n
+   REAL*8 :: dx, dy, dz, dphi, ll, ss, a, g, t
+   REAL*8, PARAMETER :: mu0_over_4pi = 1.0E-7, pi2 = 6.283185307179586
+
+   !$OMP PARALLEL DO DEFAULT(SHARED) SCHEDULE(DYNAMIC) &
+   !$OMP& PRIVATE(k1, k2, i, j, n, dx, dy, dz, dphi, ll, ss, a, g, t)
+   DO ip = 1, npair
+      k1 = pairs(ip, 1) + 1
+      k2 = pairs(ip, 2) + 1
+      ss = 0
+      IF (k1 /= k2) THEN
+         DO i = offsets(k1) + 1, offsets(k1 + 1)
+            DO j = offsets(k2) + 1, offsets(k2 + 1)
+               dx = coilxyz(i, 1) - coilxyz(j, 1)
+               dy = coilxyz(i, 2) - coilxyz(j, 2)
+               dz = coilxyz(i, 3) - coilxyz(j, 3)
+               ss = ss + (dl(i, 1)*dl(j, 1) + dl(i, 2)*dl(j, 2) + dl(i, 3)*dl(j, 3)) &
+                  & /sqrt(dx*dx + dy*dy + dz*dz)
+            END DO
+         END DO
+      ELSE
+         n = offsets(k1 + 1) - offsets(k1)
+         dphi = pi2/n
+         DO i = offsets(k1) + 1, offsets(k1 + 1)
+            ll = dl(i, 1)*dl(i, 1) + dl(i, 2)*dl(i, 2) + dl(i, 3)*dl(i, 3)
+            DO j = offsets(k1) + 1, offsets(k1 + 1)
+               dx = coilxyz(i, 1) - coilxyz(j, 1)
+               dy = coilxyz(i, 2) - coilxyz(j, 2)
+               dz = coilxyz(i, 3) - coilxyz(j, 3)
+               ss = ss + (dl(i, 1)*dl(j, 1) + dl(i, 2)*dl(j, 2) + dl(i, 3)*dl(j, 3)) &
+                  & /sqrt(dx*dx + dy*dy + dz*dz + delta(k1)) &
+                  & - ll/sqrt(2*ll*(1 - cos((i - j)*dphi))/dphi**2 + delta(k1))
+            END DO
+            ! analytic integral of the subtracted term, 4 K(m) / sqrt(4 |r'|^2 + delta)
+            a = 4*ll/dphi**2 + delta(k1)
+            ! complete elliptic integral K(m) = pi / (2 AGM(1, sqrt(1-m))), m = 4 |r'|^2 / a
+            t = 1
+            g = sqrt(delta(k1)/a)
+            DO WHILE (abs(t - g) > 1.0E-15*t)
+               dx = (t + g)/2
+               g = sqrt(t*g)
+               t = dx
+            END DO
+            ss = ss + ll/dphi*4/sqrt(a)*pi2/(4*t)
+         END DO
+      END IF
+      minduct(ip) = ss*mu0_over_4pi
+   END DO
+   !$OMP END PARALLEL DO
+
+   RETURN
+END SUBROUTINE inductance
+
+SUBROUTINE coil_forces(coilxyz, tangent, accel, offsets, currents, delta, targets, bfield, npts, ncoil, ntarget)
+   ! Calculate the magnetic field on the points of closed coils, including the regularized self-field
+   ! (all the coils are packed one after another in coilxyz, the last point of each coil repeats the first)
+   !
+   ! The field from the other coils uses the Hanson-Hirshman expression. The self-field uses
+   ! the regularized kernel of Hurwitz, Landreman & Antonsen, with the singular part integrated
+   ! analytically, i.e. the field averaged over a finite cross-section.
+   !
+   ! input params:
+   !       coilxyz(npts,3): double, xyz points for all the coils
+   !       tangent(npts,3): double, dr/dt at each point, t in [0, 2pi]
+   !       accel(npts,3): double, d^2r/dt^2 at each point
+   !       offsets(ncoil+1): int, starting index (0-based) of each coil in coilxyz, offsets(ncoil+1) = npts
+   !       currents(ncoil): double, coil currents
+   !       delta(ncoil): double, regularization of the self-field (a^2/sqrt(e) for circular sections)
+   !       targets(ntarget): int, coil indices (0-based) where the field is evaluated
+   !       npts: int, optional, total number of coil points
+   !       ncoil: int, optional, number of coils
+   !       ntarget: int, optional, number of target coils
+   ! output params:
+   !       bfield(npts,3): double, B-vec at the points of the target coils (zero for other coils)
+   IMPLICIT NONE
+
+   INTEGER, INTENT(IN) :: npts, ncoil, ntarget
+   INTEGER, INTENT(IN) :: offsets(ncoil + 1), targets(ntarget)
+   REAL*8, INTENT(IN) :: coilxyz(npts, 3), tangent(npts, 3), accel(npts, 3), currents(ncoil), delta(ncoil)
+   REAL*8, INTENT(OUT) :: bfield(npts, 3)
+
+   INTEGER :: it, i, j, k, k2, n
+   REAL*8 :: x, y, z, Rix, Riy, Riz, Ri, Rfx, Rfy, Rfz, Rf, lx, ly, lz, ll, Rfac, Bx, By, Bz, &
+      & Cx, Cy, Cz, Sx, Sy, Sz, dphi, tt, cc, r3, q3, a, g, t, e, p
+   REAL*8, PARAMETER :: mu0_over_4pi = 1.0E-7, pi2 = 6.283185307179586
+
+   bfield = 0
+   DO it = 1, ntarget
+      k = targets(it) + 1
+      n = offsets(k + 1) - offsets(k) - 1
+      dphi = pi2/n
+      !$OMP PARALLEL DO DEFAULT(SHARED) &
+      !$OMP& PRIVATE(j, k2, x, y, z, Rix, Riy, Riz, Ri, Rfx, Rfy, Rfz, Rf, lx, ly, lz, ll, Rfac, Bx, By, Bz, &
+      !$OMP& Cx, Cy, Cz, Sx, Sy, Sz, tt, cc, r3, q3, a, g, t, e, p)
+      DO i = offsets(k) + 1, offsets(k + 1) - 1
+         x = coilxyz(i, 1); y = coilxyz(i, 2); z = coilxyz(i, 3)
+         Bx = 0; By = 0; Bz = 0
+         ! field from the other coils
+         DO k2 = 1, ncoil
+            IF (k2 == k) CYCLE
+            Cx = 0; Cy = 0; Cz = 0
+            DO j = offsets(k2) + 1, offsets(k2 + 1) - 1
+               Rix = x - coilxyz(j, 1); Rfx = x - coilxyz(j + 1, 1); lx = coilxyz(j + 1, 1) - coilxyz(j, 1)
+               Riy = y - coilxyz(j, 2); Rfy = y - coilxyz(j + 1, 2); ly = coilxyz(j + 1, 2) - coilxyz(j, 2)
+               Riz = z - coilxyz(j, 3); Rfz = z - coilxyz(j + 1, 3); lz = coilxyz(j + 1, 3) - coilxyz(j, 3)
+               Ri = sqrt(Rix*Rix + Riy*Riy + Riz*Riz)
+               Rf = sqrt(Rfx*Rfx + Rfy*Rfy + Rfz*Rfz)
+               ll = sqrt(lx*lx + ly*ly + lz*lz)
+               Rfac = 2*(Ri + Rf)/(Ri*Rf)/((Ri + Rf)**2 - ll**2)
+               Cx = Cx + Rfac*(ly*Riz - lz*Riy)
+               Cy = Cy + Rfac*(lz*Rix - lx*Riz)
+               Cz = Cz + Rfac*(lx*Riy - ly*Rix)
+            END DO
+            Bx = Bx + Cx*currents(k2)
+            By = By + Cy*currents(k2)
+            Bz = Bz + Cz*currents(k2)
+         END DO
+         ! regularized self-field with the subtracted singular part, r' x r'' (1-cos)/(2|r'|^2(1-cos)+delta)^1.5
+         tt = tangent(i, 1)**2 + tangent(i, 2)**2 + tangent(i, 3)**2
+         Sx = tangent(i, 2)*accel(i, 3) - tangent(i, 3)*accel(i, 2)
+         Sy = tangent(i, 3)*accel(i, 1) - tangent(i, 1)*accel(i, 3)
+         Sz = tangent(i, 1)*accel(i, 2) - tangent(i, 2)*accel(i, 1)
+         Cx = 0; Cy = 0; Cz = 0
+         DO j = offsets(k) + 1, offsets(k + 1) - 1
+            Rix = x - coilxyz(j, 1)
+            Riy = y - coilxyz(j, 2)
+            Riz = z - coilxyz(j, 3)
+            r3 = (Rix*Rix + Riy*Riy + Riz*Riz + delta(k))**(-1.5)
+            cc = 1 - cos((j - i)*dphi)
+            q3 = cc*(2*tt*cc + delta(k))**(-1.5)
+            Cx = Cx + (tangent(j, 2)*Riz - tangent(j, 3)*Riy)*r3 - Sx*q3
+            Cy = Cy + (tangent(j, 3)*Rix - tangent(j, 1)*Riz)*r3 - Sy*q3
+            Cz = Cz + (tangent(j, 1)*Riy - tangent(j, 2)*Rix)*r3 - Sz*q3
+         END DO
+         ! analytic integral of the subtracted part, 2 (K(m) - E(m)) / (|r'|^2 sqrt(c)), c = 4 |r'|^2 + delta
+         cc = 4*tt + delta(k)
+         t = 1
+         g = sqrt(delta(k)/cc)
+         e = 4*tt/cc/2
+         p = 0.5
+         DO WHILE (abs(t - g) > 1.0E-15*t)
+            a = (t + g)/2
+            p = p*2
+            e = e + p*((t - g)/2)**2
+            g = sqrt(t*g)
+            t = a
+         END DO
+         ! K = pi / (2 AGM), E = K (1 - sum 2^(n-1) c_n^2), so K - E = K sum 2^(n-1) c_n^2
+         a = pi2/(4*t)*e*2/(tt*sqrt(cc))
+         Bx = Bx + (Cx*dphi + Sx*a)*currents(k)
+         By = By + (Cy*dphi + Sy*a)*currents(k)
+         Bz = Bz + (Cz*dphi + Sz*a)*currents(k)
+         bfield(i, 1) = Bx
+         bfield(i, 2) = By
+         bfield(i, 3) = Bz
+      END DO
+      !$OMP END PARALLEL DO
+      bfield(offsets(k + 1), :) = bfield(offsets(k) + 1, :)
+   END DO
+
+   bfield = bfield*mu0_over_4pi
+
+   RETURN
+END SUBROUTINE coil_forces
+
+SUBROUTINE parallel_frame(tangent, v0, offsets, normal, npts, ncoil)
+   ! Calculate the parallel transport (rotation-minimizing) normal along coils
+   ! (all the coils are packed one after another in tangent)
+   !
+   ! The normal is rotated from one point to the next about the axis t_i x t_(i+1), by the
+   ! angle between the two tangents (Hanson & Ma, 1995), with Rodrigues' formula
+   !     v' = v cos + c x v + c (c.v) / (1 + cos),  c = t_i x t_(i+1), cos = t_i . t_(i+1)
+   !
+   ! input params:
+   !       tangent(npts,3): double, unit tangent at each point
+   !       v0(ncoil,3): double, normal at the first point of each coil, perpendicular to the tangent
+   !       offsets(ncoil+1): int, starting index (0-based) of each coil in tangent, offsets(ncoil+1) = npts
+   !       npts: int, optional, total number of coil points
+   !       ncoil: int, optional, number of coils
+   ! output params:
+   !       normal(npts,3): double, normal at each point
+   IMPLICIT NONE
+
+   INTEGER, INTENT(IN) :: npts, ncoil
+   INTEGER, INTENT(IN) :: offsets(ncoil + 1)
+   REAL*8, INTENT(IN) :: tangent(npts, 3), v0(ncoil, 3)
+   REAL*8, INTENT(OUT) :: normal(npts, 3)
+
+   INTEGER :: k, i
+   REAL*8 :: cx, cy, cz, ct, cv, vx, vy, vz
+
+   !$OMP PARALLEL DO DEFAULT(SHARED) SCHEDULE(DYNAMIC) &
+   !$OMP& PRIVATE(i, cx, cy, cz, ct, cv, vx, vy, vz)
+   DO k = 1, ncoil
+      IF (offsets(k + 1) <= offsets(k)) CYCLE
+      vx = v0(k, 1)
+      vy = v0(k, 2)
+      vz = v0(k, 3)
+      normal(offsets(k) + 1, :) = (/vx, vy, vz/)
+      DO i = offsets(k) + 1, offsets(k + 1) - 1
+         cx = tangent(i, 2)*tangent(i + 1, 3) - tangent(i, 3)*tangent(i + 1, 2)
+         cy = tangent(i, 3)*tangent(i + 1, 1) - tangent(i, 1)*tangent(i + 1, 3)
+         cz = tangent(i, 1)*tangent(i + 1, 2) - tangent(i, 2)*tangent(i + 1, 1)
+         ct = tangent(i, 1)*tangent(i + 1, 1) + tangent(i, 2)*tangent(i + 1, 2) + tangent(i, 3)*tangent(i + 1, 3)
+         ! reversed tangents have no unique rotation, keep the normal
+         IF (ct > -1.0D0 + 1.0D-12) THEN
+            cv = (cx*vx + cy*vy + cz*vz)/(1 + ct)
+            normal(i + 1, 1) = vx*ct + cy*vz - cz*vy + cx*cv
+            normal(i + 1, 2) = vy*ct + cz*vx - cx*vz + cy*cv
+            normal(i + 1, 3) = vz*ct + cx*vy - cy*vx + cz*cv
+         ELSE
+            normal(i + 1, :) = (/vx, vy, vz/)
+         END IF
+         vx = normal(i + 1, 1)
+         vy = normal(i + 1, 2)
+         vz = normal(i + 1, 3)
+      END DO
+   END DO
+   !$OMP END PARALLEL DO
+
+   RETURN
+END SUBROUTINE parallel_frame
+
+SUBROUTINE set_num_threads(nthreads)
+   ! Set the number of OpenMP threads used by the kernels (no effect without OpenMP)
+   !
+   ! input params:
+   !       nthreads: int, number of threads
+   !$ USE omp_lib
+   IMPLICIT NONE
+
+   INTEGER, INTENT(IN) :: nthreads
+
+   !$ CALL omp_set_num_threads(nthreads)
+
+   RETURN
+END SUBROUTINE set_num_threads
+
+SUBROUTINE get_num_threads(nthreads)
+   ! Get the maximum number of OpenMP threads used by the kernels (1 without OpenMP)
+   !
+   ! output params:
+   !       nthreads: int, number of threads
+   !$ USE omp_lib
+   IMPLICIT NONE
+
+   INTEGER, INTENT(OUT) :: nthreads
+
+   nthreads = 1
+   !$ nthreads = omp_get_max_threads()
+
+   RETURN
+END SUBROUTINE get_num_threads
+
 !---------------- test case ------------
 PROGRAM test
    IMPLICIT NONE
@@ -183,4 +859,12 @@ PROGRAM test
       WRITE (6, "(3(ES12.5, ', '))") bfield(i, 1), bfield(i, 2), bfield(i, 3) - Bz
    END DO
 
+   call hanson_hirshman_coils(pos, xyz, (/0, nseg/), (/current/), bfield, npos, nseg, 1)
+   PRINT *, "Packed Hanson-Hirshman field calculation:"
+   WRITE (6, "(3(A12, ', '))") 'diff Bx', 'diff By', 'diff Bz'
+   DO i = 1, npos
+      Bz = 1.0E-7*current*pi2/(pos(i, 3)**2 + 1)**1.5
+      WRITE (6, "(3(ES12.5, ', '))") bfield(i, 1), bfield(i, 2), bfield(i, 3) - Bz
+   END DO
+
 END PROGRAM test
@@ -296,11 +296,21 @@ def trigfft2(y):
     }
 
 
-def fft_deriv(y):
+def fft_deriv(y, axis=0):
+    """Spectral derivative of periodic data sampled on [0, 2pi) (the endpoint excluded).
+
+    Args:
+        y (numpy.ndarray): Periodic data, could be complex.
+        axis (int, optional): Axis along which the derivative is taken. Defaults to 0.
+
+    Returns:
+        numpy.ndarray: Complex derivative dy/dt, the same shape as `y`.
+    """
     from scipy.fftpack import fft, ifft
 
-    N = len(y)
-    comp = fft(y)
+    y = np.asarray(y)
+    N = np.shape(y)[axis]
+    comp = fft(y, axis=axis)
     if N % 2 == 0:
         dt = (
             np.arange(N)
@@ -310,7 +320,9 @@ def fft_deriv(y):
         dt = (
             np.arange(N) - np.concatenate((np.zeros(N // 2), N * np.ones(N // 2 + 1)))
         ) * 1j
-    return ifft(comp * dt)
+    shape = np.ones(y.ndim, dtype=int)
+    shape[axis] = N
+    return ifft(comp * np.reshape(dt, shape), axis=axis)
 
 
 def trig2real(theta, zeta=None, xm=[], xn=[], fmnc=None, fmns=None):
@@ -727,6 +739,29 @@ def biot_savart(pos, xyz, current, dxyz=None):
         return biot_savart(pos, xyz, current, dxyz)
 
 
+def set_num_threads(nthreads):
+    """Set the number of OpenMP threads used by the fortran kernels.
+
+    Args:
+        nthreads (int): Number of threads. No effect if coilpy_fortran is built without OpenMP.
+    """
+    from coilpy_fortran import set_num_threads as _set_num_threads
+
+    _set_num_threads(int(nthreads))
+    return
+
+
+def get_num_threads():
+    """Get the maximum number of OpenMP threads used by the fortran kernels.
+
+    Returns:
+        int: Number of threads (1 if coilpy_fortran is built without OpenMP).
+    """
+    from coilpy_fortran import get_num_threads as _get_num_threads
+
+    return int(_get_num_threads())
+
+
 def rotation_matrix(alpha=0.0, beta=0.0, gamma=0.0, xyz=False):
     """A genera rotation matrix using yaw, pitch, and roll angles
 
@@ -673,6 +673,43 @@ class FourSurf(object):
             pass
         return
 
+    def grid(self, ntheta=64, nzeta=64, nfp=1):
+        """Surface points and unit normals on the half grid of one field period.
+
+        The grid is theta = (i+1/2)*2*pi/ntheta and zeta = (j+1/2)*2*pi/(nfp*nzeta), the
+        same as FOCUS. The result is cached until the Fourier harmonics are changed.
+
+        Args:
+            ntheta (int, optional): Poloidal resolution. Defaults to 64.
+            nzeta (int, optional): Toroidal resolution. Defaults to 64.
+            nfp (int, optional): Number of field periods, zeta covers 2*pi/nfp. Defaults to 1.
+
+        Returns:
+            numpy.ndarray: (ntheta,nzeta,3) xyz points.
+            numpy.ndarray: (ntheta,nzeta,3) unit normals, dr/dzeta x dr/dtheta normalized.
+            numpy.ndarray: (ntheta,nzeta) Jacobian, the norm of dr/dzeta x dr/dtheta.
+        """
+        harmonics = tuple(
+            np.asarray(a, dtype=float).tobytes()
+            for a in (self.xm, self.xn, self.rbc, self.rbs, self.zbc, self.zbs)
+        )
+        cache = self.__dict__.setdefault("_grid_cache", {})
+        key = (ntheta, nzeta, nfp)
+        if key in cache and cache[key][0] == harmonics:
+            return cache[key][1]
+        _theta = (np.arange(ntheta) + 0.5) * 2 * np.pi / ntheta
+        _zeta = (np.arange(nzeta) + 0.5) * 2 * np.pi / (nfp * nzeta)
+        _tv, _zv = np.meshgrid(_theta, _zeta, indexing="ij")
+        _x, _y, _z, _n = self.xyz(_tv, _zv, normal=True)
+        jacobian = np.linalg.norm(_n, axis=1)
+        grid = (
+            np.reshape(np.transpose([_x, _y, _z]), (ntheta, nzeta, 3)),
+            np.reshape(_n / jacobian[:, np.newaxis], (ntheta, nzeta, 3)),
+            np.reshape(jacobian, (ntheta, nzeta)),
+        )
+        cache[key] = (harmonics, grid)
+        return grid
+
     def grid_box(self, ntor=64, npol=64):
         """Return the max R & Z values of the surface
 
@@ -1,5 +1,17 @@
-from coilpy import Coil
+from coilpy import (
+    Coil,
+    FourierCoil,
+    FourSurf,
+    Regcoil,
+    set_num_threads,
+    get_num_threads,
+)
+from coilpy.misc import trig2real
 import numpy as np
+import glob
+import meshio
+
+np.random.seed(0)
 
 # read
 ellipse = Coil.read_makegrid("ellipse.coils")
@@ -7,6 +19,25 @@ assert ellipse.num == 16, "Coil number is read incorrectly!"
 assert len(ellipse.data[0].x) == 129, "Segment number is read incorrectly!"
 assert ellipse.data[15].I == -1e6, "Coil current is read incorrectly!"
 assert ellipse.data[10].group == 3, "Coil group is read incorrectly!"
+assert [icoil.I for icoil in Coil.iter_makegrid("ellipse.coils", group=3)] == [
+    icoil.I for icoil in ellipse if icoil.group == 3
+]
+
+# packed storage
+assert np.shares_memory(ellipse.data[3].x, ellipse.xyz)
+assert sum(1 for a in ellipse for b in ellipse) == 16**2, "Iteration is not re-entrant!"
+assert ellipse[ellipse.groups == 3].num == 4
+assert ellipse[ellipse.groups == 99].num == 0
+
+# cached segment geometry
+single = ellipse[:1].data[0]
+length = np.sum(single.lengths)
+single.magnify(2.0)
+assert np.isclose(np.sum(single.lengths), 2 * length), "Cache is not cleared!"
+single.x = single.x + 1.0
+assert np.allclose(single.midpoints[:, 0], (single.x[1:] + single.x[:-1]) / 2)
+points = np.mean(single.xyz, axis=0) + np.random.uniform(-0.1, 0.1, (5, 3))
+assert np.allclose(single.bfield(points), single.hanson_hirshman(points), rtol=1e-3)
 
 # plot
 ellipse.plot(irange=range(0, 16, 4))
@@ -24,13 +55,350 @@ ellipse.toVTK(
     "ellipse.vtk", line=False, width=0.05, height=0.05, cell_data={"z_sign": [label]}
 )
 
+# finite-build frames
+tangent, normal, binormal = ellipse.frames("parallel")
+assert np.allclose(np.sum(tangent * normal, axis=1), 0)
+assert np.allclose(binormal[: ellipse.offsets[1]], ellipse.data[0].frame("parallel")[2])
+
 # calculate B field
 b = np.array([-5.85704462e-04, 2.94453517e-03, -1.63013362e-18])
 assert np.allclose(ellipse.data[0].bfield([0, 0, 0]), b)
+pos = np.random.uniform(-1, 1, (10, 3))
+b_loop = np.sum([icoil.hanson_hirshman(pos) for icoil in ellipse], axis=0)
+assert np.allclose(ellipse.bfield(pos), b_loop), "Packed kernel is inconsistent!"
+assert np.array_equal(Coil().bfield(pos), np.zeros_like(pos))
+nthreads = get_num_threads()
+set_num_threads(2)
+assert np.allclose(ellipse.bfield(pos), b_loop), "OpenMP kernel is inconsistent!"
+set_num_threads(nthreads)
+assert np.allclose(
+    ellipse.data[3].bfield_HH(pos, chunk_size=3), ellipse.data[3].hanson_hirshman(pos)
+)
+
+# finite-build coils
+assert np.allclose(ellipse.bfield(pos, model="multifilament", nw=1, nh=1), b_loop)
+b_fb = ellipse.bfield(pos, model="multifilament", nw=3, nh=3, width=0.05, height=0.05)
+assert np.allclose(b_fb, b_loop, rtol=0, atol=1e-2 * np.max(np.abs(b_loop)))
+assert (3, 3, 0.05, 0.05, "centroid") in ellipse.data[0]._filaments
+ellipse.data[0].fourier_tangent()
+assert not ellipse.data[0]._filaments and "xyz" in ellipse.data[0]._cache
+
+# vector potential, B = curl A
+h = 1e-4
+dA = [
+    (ellipse.vector_potential(pos + h * e) - ellipse.vector_potential(pos - h * e))
+    / (2 * h)
+    for e in np.eye(3)
+]
+curlA = np.transpose(
+    [dA[1][:, 2] - dA[2][:, 1], dA[2][:, 0] - dA[0][:, 2], dA[0][:, 1] - dA[1][:, 0]]
+)
+assert np.allclose(
+    curlA, b_loop, rtol=1e-4, atol=1e-6 * np.max(np.abs(b_loop))
+), "Vector potential is inconsistent!"
+
+# field gradient
+bb, gradb = ellipse.bfield_and_grad(pos)
+assert np.allclose(bb, b_loop)
+for j, e in enumerate(np.eye(3)):
+    db = (ellipse.bfield(pos + h * e) - ellipse.bfield(pos - h * e)) / (2 * h)
+    assert np.allclose(
+        gradb[:, j, :], db, rtol=1e-4, atol=1e-6 * np.max(np.abs(gradb))
+    ), "Gradient is inconsistent!"
+
+# treecode
+near = ellipse.xyz[::7] + np.random.normal(scale=0.05, size=(len(ellipse.xyz[::7]), 3))
+phi, angle, minor = np.random.uniform(0, 2 * np.pi, (3, 200)) * [[1], [1], [0.04]]
+major = 3 + minor * np.cos(angle)
+plasma = np.transpose([major * np.cos(phi), major * np.sin(phi), minor * np.sin(angle)])
+for points in (near, plasma, pos):
+    b_direct = ellipse.bfield(points)
+    error = np.linalg.norm(ellipse.bfield(points, method="tree") - b_direct, axis=1)
+    assert np.all(
+        error < 1e-4 * np.linalg.norm(b_direct, axis=1)
+    ), "Treecode is inaccurate!"
+assert np.allclose(ellipse.bfield(pos, method="tree", tol=0.0), b_loop)
+# 40 modular coils of 500 segments and 4000 points in the plasma
+t = np.linspace(0, 2 * np.pi, 501)
+phi = 2 * np.pi * np.arange(40)[:, np.newaxis] / 40 + 0.05 * np.sin(t)
+minor = 0.6 + 0.05 * np.cos(2 * t)
+major = 3 + minor * np.cos(t)
+modular = Coil(
+    xx=major * np.cos(phi),
+    yy=major * np.sin(phi),
+    zz=np.tile(minor * np.sin(t), (40, 1)),
+    II=np.full(40, 1e5),
+    names=["mod"] * 40,
+    groups=np.arange(1, 41),
+)
+phi, angle, minor = np.random.uniform(0, 2 * np.pi, (3, 4000)) * [[1], [1], [0.05]]
+major = 3 + minor * np.cos(angle)
+plasma = np.transpose([major * np.cos(phi), major * np.sin(phi), minor * np.sin(angle)])
+b_direct = modular.bfield(plasma)
+error = np.linalg.norm(modular.bfield(plasma, method="tree") - b_direct, axis=1)
+assert (
+    np.max(error / np.linalg.norm(b_direct, axis=1)) < 2e-5
+), "Treecode is inaccurate!"
+
+# surface current on a torus, poloidal current with a toroidal ripple
+regcoil = Regcoil.__new__(Regcoil)
+regcoil.theta_coil = np.arange(64) * 2 * np.pi / 64
+regcoil.zeta_coil = np.arange(128) * 2 * np.pi / 128
+zeta, theta = np.meshgrid(regcoil.zeta_coil, regcoil.theta_coil, indexing="ij")
+major = 3 + np.cos(theta)
+regcoil.r_coil = np.stack(
+    (major * np.cos(zeta), major * np.sin(zeta), np.sin(theta)), axis=-1
+)
+drdtheta = np.stack(
+    (-np.sin(theta) * np.cos(zeta), -np.sin(theta) * np.sin(zeta), np.cos(theta)),
+    axis=-1,
+)
+regcoil.norm_normal_coill = major.T
+regcoil.k = (1e5 * (1 + 0.3 * np.cos(4 * zeta))[..., np.newaxis] * drdtheta).T
+b_direct = regcoil.bfield(plasma[:2000])
+for tol, bound in ((0.2, 1e-5), (0.5, 2e-3)):
+    b_tree = regcoil.bfield(plasma[:2000], method="tree", tol=tol)
+    error = np.linalg.norm(b_tree - b_direct, axis=1)
+    assert (
+        np.max(error / np.linalg.norm(b_direct, axis=1)) < bound
+    ), "Treecode is inaccurate!"
+assert np.allclose(regcoil.bfield(plasma[:5], fortran=False), b_direct[:5])
+dA = [
+    (regcoil.vector_potential(pos + h * e) - regcoil.vector_potential(pos - h * e))
+    / (2 * h)
+    for e in np.eye(3)
+]
+curlA = np.transpose(
+    [dA[1][:, 2] - dA[2][:, 1], dA[2][:, 0] - dA[0][:, 2], dA[0][:, 1] - dA[1][:, 0]]
+)
+b_surface = regcoil.bfield(pos)
+assert np.allclose(
+    curlA, b_surface, rtol=1e-4, atol=1e-6 * np.max(np.abs(b_surface))
+), "Vector potential is inconsistent!"
+
+# symmetry
+half = ellipse.unique(stellsym=True)
+assert half.num == 4 and half.nfp == 2, "Symmetric coils are identified incorrectly!"
+assert np.allclose(half.bfield(pos), b_loop), "Symmetric field is inconsistent!"
+bs, gs = half.bfield_and_grad(pos)
+assert np.allclose(gs, gradb)
+assert np.allclose(half.unfold().data[15].x, ellipse.data[15].x)
+assert np.allclose(half.replicate_periods(2, stellsym=True).xyz, ellipse.xyz)
+assert np.allclose(half.mirror().currents, -half.currents)
+scaled = half[:].scale(2.0, center=[1, 0, 0])
+assert np.isclose(np.sum(scaled.data[0].lengths), 2 * np.sum(half.data[0].lengths))
+
+# normal field
+surf = FourSurf(
+    xm=[0, 1, 1],
+    xn=[0, 0, 2],
+    rbc=[3, 0.2, 0.02],
+    zbs=[0, 0.2, 0.02],
+    rbs=[0] * 3,
+    zbc=[0] * 3,
+)
+bn, spec = half.bnormal(surf, ntheta=16, nzeta=8, nfp_reduce=True)
+assert np.allclose(bn, ellipse.bnormal(surf, ntheta=16, nzeta=16)[0][:, :8])
+assert np.allclose(bn, ellipse.bnormal(surf, 16, 8, nfp_reduce=True)[0])
+for coil, nfp in ((half, 4), (ellipse, 4)):
+    try:
+        coil.bnormal(surf, nfp_reduce=True, nfp=nfp)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Inconsistent coil periods are not detected!")
+try:
+    tilted = FourSurf([0, 1], [0, 1], [3, 0.2], [0, 0.2], [0, 0], [0, 0])
+    half.bnormal(tilted, nfp_reduce=True)
+except ValueError:
+    pass
+else:
+    raise AssertionError("Inconsistent surface periods are not detected!")
+theta = (np.arange(16) + 0.5) * np.pi / 8
+rec = trig2real(theta, theta[:8], spec["xm"], 2 * spec["xn"], spec["bnc"], spec["bns"])
+assert np.allclose(rec, bn)
+
+# quadratic flux
+flux, grad, dcurrent = half.quadratic_flux(surf, ntheta=16, nzeta=8, nfp_reduce=True)
+assert np.isclose(flux, ellipse.quadratic_flux(surf, 16, 16, gradient=False))
+try:
+    ellipse.quadratic_flux(surf, 16, 8, nfp_reduce=True, gradient=False)
+except ValueError:
+    pass
+else:
+    raise AssertionError("A non-symmetric coil set is reduced to one period!")
+h = 1e-6
+shifted = [half[:], half[:]]
+for sign, coil in zip((1, -1), shifted):
+    coil.transform(shift=[sign * h, 0, 0])
+dflux = [
+    coil.quadratic_flux(surf, 16, 8, nfp_reduce=True, gradient=False)
+    for coil in shifted
+]
+assert np.isclose((dflux[0] - dflux[1]) / (2 * h), np.sum(grad[:, 0]), rtol=1e-5)
+assert np.isclose(np.dot(dcurrent, half.currents), 0, atol=1e-8 * flux)
+fourier = FourierCoil.from_coil(half, nf=8)
+kwargs = dict(num=64, ntheta=16, nzeta=8, nfp_reduce=True)
+flux, grads = fourier.quadratic_flux(surf, **kwargs)
+fourier.zs[1, 1] += h
+dflux = fourier.quadratic_flux(surf, gradient=False, **kwargs) - flux
+assert np.isclose(dflux / h, grads["zs"][1, 1], rtol=1e-4)
+
+# response matrix
+currents = np.array([icoil.I for icoil in ellipse])
+ellipse.response_matrix(pos)
+assert np.allclose(ellipse.bfield_from_currents(currents), b_loop)
+assert np.allclose(half.response_matrix(pos, group=True).sum(axis=0), b_loop)
+moved = ellipse[:]
+moved.response_matrix(pos)
+moved.scale(1.1)
+assert np.allclose(moved.bfield_from_currents(currents), moved.bfield(pos))
+moved.data[0].x[3] += 0.1
+assert np.allclose(moved.bfield_from_currents(currents), moved.bfield(pos))
+
+# inductance
+theta = np.linspace(0, 2 * np.pi, 129)
+loop = Coil(
+    xx=[np.cos(theta)],
+    yy=[np.sin(theta)],
+    zz=[0 * theta],
+    II=[1.0],
+    names=["loop"],
+    groups=[1],
+)
+L_loop = 4e-7 * np.pi * (np.log(8 / 0.01) - 7 / 4)
+assert np.isclose(loop.inductance_matrix(radius=0.01)[0, 0], L_loop, rtol=1e-4)
+inductance = ellipse.inductance_matrix(radius=0.01)
+assert np.allclose(inductance, inductance.T)
+assert np.allclose(half.inductance_matrix(radius=0.01), inductance)
+
+# forces
+density, force, torque = loop.forces(radius=0.01)
+hoop = 1e-7 * (np.log(8 / 0.01) - 3 / 4)
+assert np.allclose(density, hoop * loop.xyz, rtol=1e-4, atol=1e-10)
+density, force, torque = ellipse.forces(radius=0.01)
+atol = 1e-8 * np.max(np.abs(force))
+assert np.allclose(np.sum(force, axis=0), 0, atol=atol)
+assert np.allclose(half.forces(radius=0.01)[1], force[::4], atol=atol)
+
+# geometry
+metrics, pointwise = loop.geometry_metrics(pointwise=True)
+assert np.isclose(metrics["length"][0], 2 * np.pi)
+assert np.allclose(pointwise["curvature"], 1.0)
+assert len(ellipse.geometry_metrics()) == ellipse.num
+
+# Fourier coils
+fourier = FourierCoil.from_coil(ellipse)
+assert np.allclose(fourier.xyz(128).reshape(-1, 3), ellipse.xyz)
+assert np.allclose(FourierCoil.from_coil(loop).curvature(32), 1.0)
+b_fine = fourier.bfield(pos, num=1024, method="biot_savart")
+assert np.allclose(b_fine, Coil.from_fourier(fourier, num=2048).bfield(pos), rtol=1e-5)
+# FOCUS files keep the symmetry of the coils
+symmetric = FourierCoil.from_coil(half, nf=8)
+symmetric.save_focus("half.focus")
+focus = FourierCoil.read_focus("half.focus", nfp=2)
+assert focus.nfp == 2 and focus.stellsym and np.all(focus.names == half.names)
+for key in ("xc", "xs", "yc", "ys", "zc", "zs", "currents"):
+    assert np.allclose(getattr(focus, key), getattr(symmetric, key))
+assert np.allclose(Coil.read_focus("half.focus", nfp=2).bfield(pos), b_loop, rtol=1e-4)
+unfolded = FourierCoil.from_coil(half.unfold(), nf=8)
+assert np.allclose(focus.unfold().zs, unfolded.zs)
+assert np.allclose(focus.unfold().currents, unfolded.currents)
+with open("half.focus") as f:
+    text = f.read()
+with open("mixed.focus", "w") as f:
+    f.write(text.replace("   1  2  ", "   1  0  ", 1))
+assert FourierCoil.read_focus("mixed.focus", nfp=2).num == 1 + 3 * 4
+with open("empty.focus", "w") as f:
+    f.write(" # Total number of coils \n     0 \n")
+assert FourierCoil.read_focus("empty.focus").num == 0
+
+# distance
+ring = Coil(
+    xx=[np.cos(theta), np.cos(theta)],
+    yy=[np.sin(theta), np.sin(theta)],
+    zz=[0 * theta, 0 * theta + 0.3],
+    II=[1.0, 1.0],
+    names=["a", "b"],
+    groups=[1, 2],
+)
+dist, pair, closest = ring.min_coil_coil_distance()
+assert np.isclose(dist, 0.3) and pair == (0, 1)
+assert np.isclose(half.min_coil_coil_distance()[0], ellipse.min_coil_coil_distance()[0])
+dist, index = ring.min_distance_to([[0, 0, 0], [0, 0, 2]])
+inner = np.cos(np.pi / 128)
+assert np.allclose(dist, [inner, np.sqrt(inner**2 + 0.09)]) and np.all(index == 0)
 
 # misc
-ellipse.data[1].interpolate()
+resampled = ellipse[:2]
+resampled.interpolate(num=200, nf=10)
+ellipse.data[1].interpolate(num=200, nf=10)
+assert np.allclose(resampled.data[1].x, ellipse.data[1].x)
+magnified = ellipse[:].magnify(1.5)
+for index, icoil in enumerate(magnified):
+    scaled = ellipse[index : index + 1]
+    scaled.scale(1.5, center=np.mean(scaled.xyz[:-1], axis=0))
+    assert np.allclose(icoil.xyz, scaled.xyz)
+    assert np.array_equal(icoil.xyz[0], icoil.xyz[-1])
 ellipse.data[1].magnify(ratio=2.0)
 
 # save
 ellipse.save_makegrid("test.coils")
+ellipse.save_makegrid("test.coils.gz")
+with open("test.coils") as f:
+    assert Coil.read_makegrid("test.coils.gz").num == ellipse.num
+    text = f.read()
+    assert text.count("\n") == len(ellipse.xyz) + 4
+    assert text.split()[:2] == ["periods", "2"], "Periods are not kept!"
+# bulk parser against a line-by-line reader, with group and name columns
+with open("mixed.coils", "w") as f:
+    f.write("periods 2\nbegin filament\nmirror NIL\n")
+    for icoil, tail in enumerate(["1 Mod_1", "2", "mod Mod_3", "2 Mod_4"]):
+        points = np.random.uniform(-1, 1, (5, 3))
+        for point in points:
+            f.write("{:15.7E} {:15.7E} {:15.7E} {:15.7E}\n".format(*point, icoil + 1.5))
+        f.write(
+            "{:15.7E} {:15.7E} {:15.7E} {:15.7E} {}\n".format(*points[0], 0.0, tail)
+        )
+    f.write("end\n")
+xyz, currents, groups, names = [[]], [], [], []
+with open("mixed.coils") as f:
+    for line in f.readlines()[3:]:
+        columns = line.split()
+        if len(columns) < 4:
+            break
+        xyz[-1].append([float(v) for v in columns[:3]])
+        if len(columns) == 4:
+            current = float(columns[3])
+        else:
+            currents.append(current)
+            groups.append(int(columns[4]) if columns[4].isdigit() else len(groups) + 1)
+            names.append(columns[5] if len(columns) > 5 else "coil")
+            xyz.append([])
+mixed = Coil.read_makegrid("mixed.coils")
+assert mixed.periods == 2 and np.allclose(mixed.xyz, np.concatenate(xyz[:-1]))
+assert np.allclose(mixed.currents, currents) and list(mixed.groups) == groups
+assert list(mixed.names) == names
+with open("mixed.coils", "rb") as f:
+    assert Coil.read_makegrid(f).header == mixed.header
+assert mixed.header.split()[:2] == ["periods", "2"] and not hasattr(Coil, "header")
+chunked = list(Coil.iter_makegrid("mixed.coils", group=2, chunk_size=50))
+assert [icoil.name for icoil in chunked] == ["coil", "Mod_4"]
+assert np.allclose(chunked[1].x, mixed.data[3].x) and chunked[1].I == currents[3]
+chunked = Coil.iter_makegrid("test.coils", chunk_size=100)
+assert np.allclose(np.concatenate([icoil.z for icoil in chunked]), ellipse.xyz[:, 2])
+half.save_binary("test.h5")
+binary = Coil.load_binary("test.h5", mmap=True)
+assert np.array_equal(binary.xyz, half.xyz) and isinstance(binary.xyz.base, np.memmap)
+assert np.allclose(binary.bfield(pos), b_loop)
+binary.scale(2.0)
+assert np.allclose(binary.xyz, 2 * half.xyz)
+assert np.array_equal(Coil.load_binary("test.h5", mmap=True).xyz, half.xyz)
+# symmetric coil sets are unfolded when exported
+half.save_gpec_coils("test.gpec", split=False)
+with open("test.gpec") as f:
+    assert int(f.readline().split()[0]) == 16
+half.save_gpec_coils("gpec_", split=True)
+assert len(glob.glob("gpec_*.dat")) == 16
+half.toVTK("half.vtu", line=False)
+assert np.max(meshio.read("half.vtu").cell_data["index"][0]) == 16